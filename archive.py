@@ -0,0 +1,200 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import re
+import zlib
+import cStringIO
+import threading
+from collections import OrderedDict
+from zipfile import ZipFile, BadZipfile, is_zipfile
+
+
+# Pages don't have to be loose files; they can also be read straight out of a
+# CBZ (or any ZIP) archive. A page inside an archive is named by the path of
+# the archive and the name of the page within it, joined by ArchiveSeparator,
+# like "/comics/volume1.cbz!/page001.jpg". Everything that reads, stats or
+# hashes a source image goes through here, so it works with either.
+
+ArchiveSeparator = '!/'
+ArchiveExtensions = ['.cbz', '.zip']
+ImageExtensions = ['.jpeg', '.jpg', '.gif', '.png']
+
+SourcePattern = re.compile(
+    r'^(.*?(?:%s))%s(.*)$' % ('|'.join([re.escape(ext) for ext in ArchiveExtensions]), re.escape(ArchiveSeparator)),
+    re.IGNORECASE | re.DOTALL
+)
+
+# Reading every page of a book from the same archive shouldn't mean opening
+# it, and reading its directory, once per page, so the last few archives read
+# from are kept open. Every worker process has its own. Within a process,
+# they're shared by every thread, so only one at a time may use them.
+MaxOpenArchives = 4
+openArchives = OrderedDict()
+archiveLock = threading.RLock()
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Splits a source into the archive it's in and its name within the
+# archive. For a loose file, the name is None.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def splitSource(source):
+    match = SourcePattern.match(source)
+    if match == None:
+        return source, None
+    return match.group(1), match.group(2)
+
+
+def joinSource(filename, member):
+    return filename + ArchiveSeparator + member
+
+
+def absoluteSource(source):
+    filename, member = splitSource(source)
+    filename = os.path.abspath(filename)
+    return filename if member == None else joinSource(filename, member)
+
+
+def isArchiveFile(filename):
+    filename = unicode(filename)
+    return (
+        os.path.splitext(filename)[1].lower() in ArchiveExtensions and
+        os.path.isfile(filename) and
+        is_zipfile(filename)
+    )
+
+
+def isImageName(name):
+    return os.path.splitext(name)[1].lower() in ImageExtensions
+
+
+def memberName(info):
+    # Unless the archive says otherwise, ZIP file names are in code page 437,
+    # and Python 2 leaves them undecoded.
+    if isinstance(info.filename, unicode):
+        return info.filename
+    return info.filename.decode('cp437')
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Returns an open archive and a map from its member names to their
+# entries, reusing the ones we already have open unless the file
+# has changed since.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def getArchive(filename):
+    try:
+        info = os.stat(filename)
+    except OSError:
+        raise IOError('Cannot read archive %s' % filename)
+    stamp = (info.st_mtime, info.st_size)
+
+    entry = openArchives.pop(filename, None)
+    if entry != None and entry[0] != stamp:
+        entry[1].close()
+        entry = None
+
+    if entry == None:
+        try:
+            archive = ZipFile(filename, 'r')
+        except (IOError, BadZipfile):
+            raise IOError('Cannot read archive %s' % filename)
+
+        members = dict([(memberName(info), info) for info in archive.infolist()])
+        entry = (stamp, archive, members)
+
+        while len(openArchives) >= MaxOpenArchives:
+            openArchives.popitem(last=False)[1][1].close()
+
+    openArchives[filename] = entry
+    return entry[1], entry[2]
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Starts over with no archives open and a new lock, without touching
+# what we had. This is for a process that was just forked, where the
+# old lock may have been held by a thread that didn't come along,
+# and the open archives share their file positions with the parent's.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def forgetArchives():
+    global openArchives, archiveLock
+    openArchives = OrderedDict()
+    archiveLock = threading.RLock()
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Returns the source images in an archive, in the order of their
+# names, which is how the pages of a CBZ are meant to be read.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def listArchive(filename):
+    filename = unicode(filename)
+
+    archiveLock.acquire()
+    try:
+        archive, members = getArchive(filename)
+        names = [
+            name for name in members
+            if isImageName(name) and not name.startswith('__MACOSX/')
+        ]
+    finally:
+        archiveLock.release()
+    names.sort()
+
+    return [joinSource(filename, name) for name in names]
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Opens a source image for reading. A page in an archive is read
+# into memory, rather than extracted anywhere, since PIL needs to be
+# able to seek around in it. Raises IOError if it can't be read.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def openSource(source):
+    filename, member = splitSource(source)
+    if member == None:
+        return open(source, 'rb')
+
+    archiveLock.acquire()
+    try:
+        archive, members = getArchive(filename)
+        if member not in members:
+            raise IOError('Cannot find %s in archive %s' % (member, filename))
+
+        try:
+            return cStringIO.StringIO(archive.read(members[member]))
+        except (BadZipfile, RuntimeError, zlib.error):
+            raise IOError('Cannot read %s from archive %s' % (member, filename))
+    finally:
+        archiveLock.release()
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Returns the size and modification time of a source image. A page
+# in an archive takes the archive's modification time, so it counts
+# as changed whenever the archive does.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def statSource(source):
+    filename, member = splitSource(source)
+    if member == None:
+        info = os.stat(source)
+        return info.st_size, info.st_mtime
+
+    archiveLock.acquire()
+    try:
+        archive, members = getArchive(filename)
+        if member not in members:
+            raise IOError('Cannot find %s in archive %s' % (member, filename))
+
+        return members[member].file_size, os.stat(filename).st_mtime
+    finally:
+        archiveLock.release()
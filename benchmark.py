@@ -0,0 +1,388 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import multiprocessing
+from timeit import default_timer
+from optparse import OptionParser
+
+# Peak memory comes from the OS, which only works where there's a resource
+# module. Everywhere else, it's just left out of the results.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from PIL import Image, ImageDraw
+
+import image
+from image import ImageFlags, ImageDither, ImageFormat, KindleData
+
+
+# The synthetic source images every stage is run on: single pages, double
+# page spreads and long webcomic-style strips, in grayscale and color, saved
+# as JPEG and PNG like the scans people actually feed in.
+Samples = [
+    ('page-gray.jpg', (1200, 1700), 'L'),
+    ('page-color.jpg', (1200, 1700), 'RGB'),
+    ('page-gray.png', (1200, 1700), 'L'),
+    ('spread-gray.jpg', (2400, 1700), 'L'),
+    ('spread-color.png', (2400, 1700), 'RGB'),
+    ('strip-color.jpg', (800, 12000), 'RGB')
+]
+
+# The flag combinations people actually export with.
+FlagSets = {
+    'default': ImageFlags.Orient | ImageFlags.Shrink | ImageFlags.Quantize,
+    'split': ImageFlags.Split | ImageFlags.RightToLeft | ImageFlags.Shrink | ImageFlags.Quantize,
+    'frame': ImageFlags.Orient | ImageFlags.Shrink | ImageFlags.Frame | ImageFlags.Quantize,
+    'resize': ImageFlags.Shrink | ImageFlags.Enlarge,
+    'none': 0
+}
+
+Stages = ['format', 'resize', 'orient', 'split', 'frame', 'quantize', 'encode', 'convert']
+
+# The stages that are worth running more than one way.
+Variants = {
+    'quantize': ImageDither.Methods,
+    'encode': [ImageFormat.Png, ImageFormat.Jpeg],
+    'convert': sorted(FlagSets)
+}
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Draws a fake page: a gradient with noise over it for texture,
+# like screentone or scan grain, plus solid panel borders and blocks
+# of "text", so resizing, dithering and compressing all have about
+# as much work to do as they would on a real scan.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def makeSample(size, mode, seed):
+    width, height = size
+    generator = random.Random(seed)
+
+    def layer(angle):
+        gradient = Image.linear_gradient('L').rotate(angle).resize(size, Image.BILINEAR)
+        return Image.blend(gradient, Image.effect_noise(size, 48), 0.4)
+
+    if mode == 'L':
+        sample = layer(0)
+    else:
+        sample = Image.merge('RGB', [layer(0), layer(120), layer(240)])
+
+    draw = ImageDraw.Draw(sample)
+    black = 0 if mode == 'L' else (0, 0, 0)
+    white = 255 if mode == 'L' else (255, 255, 255)
+
+    # Cut the page into rows of panels the way a comic would be.
+    top = 20
+    while top < height - 120:
+        bottom = min(height - 20, top + generator.randint(300, 600))
+        left = 20
+        while left < width - 120:
+            right = min(width - 20, left + generator.randint(250, 700))
+            for inset in xrange(6):
+                draw.rectangle([left + inset, top + inset, right - inset, bottom - inset], outline=black)
+
+            # A speech bubble's worth of text lines.
+            x = generator.randint(left + 10, max(left + 10, right - 160))
+            y = generator.randint(top + 10, max(top + 10, bottom - 120))
+            draw.rectangle([x, y, x + 150, y + 110], fill=white)
+            for line in xrange(y + 10, y + 100, 14):
+                draw.rectangle([x + 10, line, x + generator.randint(60, 140), line + 6], fill=black)
+
+            left = right + 20
+        top = bottom + 20
+
+    return sample
+
+
+def makeSamples(directory):
+    for seed, (name, size, mode) in enumerate(Samples):
+        sample = makeSample(size, mode, seed)
+        if name.endswith('.jpg'):
+            sample.save(os.path.join(directory, name), 'JPEG', quality=90)
+        else:
+            sample.save(os.path.join(directory, name), 'PNG')
+
+
+def peakMemory():
+    if resource == None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports this in kilobytes, but OS X uses bytes.
+    if sys.platform == 'darwin':
+        peak = peak / 1024
+    return peak
+
+
+# For the stages that always turn one image into one page.
+def onePage(function, *args):
+    def run():
+        function(*args)
+        return 1
+    return run
+
+
+# Swallows whatever the encoder writes, so only the encoding gets timed.
+class NullOutput:
+    def write(self, data):
+        pass
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Sets up one stage for one source image and device, and returns a
+# function that runs just that stage and returns how many pages it
+# made. Each stage gets the kind of image it gets in convertImage().
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def prepareStage(stage, source, device, variant):
+    profile = KindleData.Profiles[device]
+    size = profile.size
+
+    if stage == 'convert':
+        flags = FlagSets[variant]
+        return lambda: len(image.convertImage(source, device, flags))
+
+    original = Image.open(source)
+    original.load()
+
+    if stage == 'format':
+        return onePage(image.formatImage, original, profile.mode)
+
+    formatted = image.formatImage(original, profile.mode)
+    page = image.resizeImage(formatted, size, True, True)
+
+    if stage == 'resize':
+        return onePage(image.resizeImage, formatted, size, True, True)
+
+    if stage == 'orient':
+        fitted = image.resizeImage(formatted, image.fitSize(formatted, size, True, False), True, False)
+        return onePage(image.orientImage, fitted, size)
+
+    if stage == 'split':
+        fitted = image.resizeImage(formatted, image.fitSize(formatted, size, False, True), True, False)
+        return lambda: len(image.splitImage(fitted, size, True))
+
+    if stage == 'frame':
+        return onePage(image.frameImage, page, profile.foreground, profile.background, size)
+
+    if stage == 'quantize':
+        return onePage(image.quantizeImage, page, profile, variant)
+
+    if stage == 'encode':
+        quantized = image.quantizeImage(page, profile)
+        return onePage(image.encodeImage, quantized, NullOutput(), device, variant)
+
+    raise RuntimeError('Unexpected stage %s' % stage)
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Times one case. This runs in a fresh worker process for every
+# case, so the peak memory it reports belongs to that case alone.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def runCase(case):
+    stage, sample, device, variant, repeat, directory = case
+    result = {
+        'stage': stage,
+        'sample': sample,
+        'device': device,
+        'variant': variant,
+        'repeat': repeat
+    }
+
+    baseline = peakMemory()
+
+    try:
+        run = prepareStage(stage, os.path.join(directory, sample), device, variant)
+
+        times = []
+        for i in xrange(repeat):
+            begin = default_timer()
+            pages = run()
+            times.append(default_timer() - begin)
+    except RuntimeError, error:
+        result['error'] = str(error)
+        return result
+
+    times.sort()
+    result['pages'] = pages
+    result['min'] = times[0] / pages
+    result['median'] = times[len(times) / 2] / pages
+
+    peak = peakMemory()
+    if peak != None:
+        result['peakKB'] = peak - baseline
+
+    return result
+
+
+def makeCases(options, directory):
+    cases = []
+    for stage in Stages:
+        if options.stages and stage not in options.stages:
+            continue
+        for sample, size, mode in Samples:
+            for device in sorted(KindleData.Profiles):
+                if options.devices and device not in options.devices:
+                    continue
+                for variant in Variants.get(stage, ['']):
+                    cases.append((stage, sample, device, variant, options.repeat, directory))
+
+    return cases
+
+
+def caseName(result):
+    name = '%s %s %s' % (result['stage'], result['sample'], result['device'])
+    if result['variant']:
+        name += ' (%s)' % result['variant']
+    return name
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Compares two sets of results by median time per page, and
+# returns how many cases got slower by more than the threshold.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def compare(baseName, newName, threshold):
+    def load(filename):
+        results = {}
+        for result in json.load(open(filename, 'rb'))['results']:
+            if 'median' in result:
+                results[caseName(result)] = result
+        return results
+
+    base = load(baseName)
+    new = load(newName)
+    regressions = 0
+
+    for name in sorted(set(base) & set(new)):
+        before = base[name]['median']
+        after = new[name]['median']
+        change = 100.0 * (after - before) / before if before else 0.0
+
+        mark = ''
+        if change > threshold:
+            mark = '  SLOWER'
+            regressions += 1
+        elif change < -threshold:
+            mark = '  faster'
+
+        print '%-60s %9.2f ms %9.2f ms %+7.1f%%%s' % (name, before * 1000, after * 1000, change, mark)
+
+    return regressions
+
+
+def main(argv):
+    parser = OptionParser(
+        usage='%prog [options]\n       %prog --compare BASE.json NEW.json',
+        description='Times every stage of the image conversion pipeline, and the '
+                    'whole of it, on generated pages for every device, and writes '
+                    'the results out as JSON.'
+    )
+    parser.add_option('-o', '--output', default=None,
+                      help='file to write the results to (default: standard output)')
+    parser.add_option('-n', '--repeat', type='int', default=5,
+                      help='times to run each case; the median and best times are kept (default: %default)')
+    parser.add_option('-s', '--stage', action='append', dest='stages', default=[], choices=Stages,
+                      help='only run this stage (may be given more than once): %s' % ', '.join(Stages))
+    parser.add_option('-d', '--device', action='append', dest='devices', default=[],
+                      help='only run for this device (may be given more than once)')
+    parser.add_option('--quick', action='store_true', default=False,
+                      help='only run for one grayscale and one color device, three times each')
+    parser.add_option('--compare', action='store_true', default=False,
+                      help='compare two earlier result files instead of running anything')
+    parser.add_option('--threshold', type='float', default=10.0,
+                      help='percentage by which a case has to get slower to count as a regression (default: %default)')
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help='don\'t report progress')
+    options, args = parser.parse_args(argv[1:])
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error('expected two result files to compare')
+        return 1 if compare(args[0], args[1], options.threshold) else 0
+
+    if args:
+        parser.error('unexpected arguments')
+
+    for device in options.devices:
+        if device not in KindleData.Profiles:
+            parser.error('unknown device %s' % device)
+
+    if options.quick:
+        options.devices = options.devices or ['Kindle 3', 'nook color']
+        options.repeat = min(options.repeat, 3)
+
+    directory = tempfile.mkdtemp(prefix='mangle-benchmark-')
+    try:
+        makeSamples(directory)
+        cases = makeCases(options, directory)
+
+        # A new process for every case, so each one's peak memory is its own.
+        pool = multiprocessing.Pool(1, maxtasksperchild=1)
+        results = []
+        try:
+            for index, result in enumerate(pool.imap(runCase, cases, 1)):
+                results.append(result)
+                if not options.quiet:
+                    if 'error' in result:
+                        status = result['error']
+                    else:
+                        status = '%.2f ms/page' % (result['median'] * 1000)
+                    sys.stderr.write('[%d/%d] %s: %s\n' % (index + 1, len(cases), caseName(result), status))
+        except KeyboardInterrupt:
+            pool.terminate()
+            raise
+        pool.close()
+        pool.join()
+    finally:
+        shutil.rmtree(directory, True)
+
+    report = {
+        'version': 1,
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'pil': getattr(Image, '__version__', getattr(Image, 'VERSION', None)),
+            'numpy': image.numpy != None,
+            'platform': platform.platform(),
+            'processors': multiprocessing.cpu_count()
+        },
+        'results': results
+    }
+
+    if options.output:
+        output = open(options.output, 'wb')
+        json.dump(report, output, indent=1, sort_keys=True)
+        output.close()
+    else:
+        json.dump(report, sys.stdout, indent=1, sort_keys=True)
+        sys.stdout.write('\n')
+
+    return 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main(sys.argv))
@@ -15,176 +15,17 @@
 
 
 import os
-from PyQt4 import QtGui, QtCore, QtXml
+from PyQt4 import QtGui, QtCore
 
 import image
-from image import ImageFlags
+import archive
+from bookfile import Book
+from scanner import DirectoryScanner
 from about import DialogAbout
 from options import DialogOptions
 from convert import DialogConvert
 from ui.book_ui import Ui_MainWindowBook
 
-class Book:
-    DefaultDevice = 'Kindle 3'
-    DefaultOverwrite = True
-    DefaultCBZ = False
-    DefaultImageFlags = ImageFlags.Orient | ImageFlags.Shrink | ImageFlags.Quantize
-    DefaultsXML = 'defaults.xml'
-
-
-    def __init__(self):
-        self.images = []
-        self.filename = None
-        self.modified = False
-        self.title = None
-        self.load_defaults(Book.DefaultsXML)
-
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # Saves the current settings as the defaults.
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    def save_defaults(self, filename = DefaultsXML):
-        document = QtXml.QDomDocument()
-
-        root = document.createElement('defaults')
-        document.appendChild(root)
-
-        root.setAttribute('overwrite', 'true' if self.overwrite else 'false')
-        root.setAttribute('device', self.device)
-        root.setAttribute('orientImages', 'true' if self.imageFlags & ImageFlags.Orient else 'false')
-        root.setAttribute('shrinkImages', 'true' if self.imageFlags & ImageFlags.Shrink else 'false')
-        root.setAttribute('frameImages', 'true' if self.imageFlags & ImageFlags.Frame else 'false')
-        root.setAttribute('ditherImages', 'true' if self.imageFlags & ImageFlags.Quantize else 'false')
-        root.setAttribute('enlargeImages', 'true' if self.imageFlags & ImageFlags.Enlarge else 'false')
-        root.setAttribute('splitImages', 'true' if self.imageFlags & ImageFlags.Split else 'false')
-        root.setAttribute('rightToLeft', 'true' if self.imageFlags & ImageFlags.RightToLeft else 'false')
-        root.setAttribute('cbz', 'true' if self.cbz else 'false')
-
-        textXml = document.toString(4).toUtf8()
-
-        try:
-            fileXml = open(unicode(filename), 'w')
-            fileXml.write(textXml)
-            fileXml.close()
-        except IOError:
-            raise RuntimeError('Cannot create defaults file %s' % filename)
-
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # Loads the default settings from a file.
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    def load_defaults(self, filename = DefaultsXML):
-        try:
-            fileXml = open(unicode(filename), 'r')
-            textXml = fileXml.read()
-            fileXml.close()
-        except IOError:
-            self.device = Book.DefaultDevice
-            self.overwrite = Book.DefaultOverwrite
-            self.imageFlags = Book.DefaultImageFlags
-            self.cbz = Book.DefaultCBZ
-            self.save_defaults(filename)
-            return
-
-        document = QtXml.QDomDocument()
-
-        if not document.setContent(QtCore.QString.fromUtf8(textXml)):
-            raise RuntimeError('Error parsing defaults file %s' % filename)
-
-        root = document.documentElement()
-        if root.tagName() != 'defaults':
-            raise RuntimeError('Unexpected defaults format in file %s' % filename)
-
-        self.overwrite = root.attribute('overwrite', 'true' if Book.DefaultOverwrite else 'false') == 'true'
-        self.device = root.attribute('device', Book.DefaultDevice)
-        
-        orient = root.attribute('orientImages', 'true' if Book.DefaultImageFlags & ImageFlags.Orient else 'false') == 'true'
-        split = root.attribute('splitImages', 'true' if Book.DefaultImageFlags & ImageFlags.Split else 'false') == 'true'
-        shrink = root.attribute('shrinkImages', 'true' if Book.DefaultImageFlags & ImageFlags.Shrink else 'false') == 'true'
-        enlarge = root.attribute('enlargeImages', 'true' if Book.DefaultImageFlags & ImageFlags.Enlarge else 'false') == 'true'
-        frame = root.attribute('frameImages', 'true' if Book.DefaultImageFlags & ImageFlags.Frame else 'false') == 'true'
-        dither = root.attribute('ditherImages', 'true' if Book.DefaultImageFlags & ImageFlags.Quantize else 'false') == 'true'
-        rtl = root.attribute('rightToLeft', 'true' if Book.DefaultImageFlags & ImageFlags.RightToLeft else 'false') == 'true'
-        self.imageFlags = (
-            (ImageFlags.Orient if orient else 0) |
-            (ImageFlags.Split if split else 0) |
-            (ImageFlags.Shrink if shrink else 0) |
-            (ImageFlags.Enlarge if enlarge else 0) |
-            (ImageFlags.Frame if frame else 0) |
-            (ImageFlags.Quantize if dither else 0) |
-            (ImageFlags.RightToLeft if rtl else 0)
-        )
-        
-        self.cbz = root.attribute('cbz', 'true' if Book.DefaultCBZ else 'false') == 'true'
-
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # Saves the current state to a book file.
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    def save(self, filename):
-        document = QtXml.QDomDocument()
-
-        root = document.createElement('book')
-        document.appendChild(root)
-
-        root.setAttribute('title', self.title)
-        root.setAttribute('overwrite', 'true' if self.overwrite else 'false')
-        root.setAttribute('device', self.device)
-        root.setAttribute('imageFlags', self.imageFlags)
-        root.setAttribute('cbz', 'true' if self.cbz else 'false')
-
-        for filenameImg in self.images:
-            itemImg = document.createElement('image')
-            root.appendChild(itemImg)
-            itemImg.setAttribute('filename', filenameImg)
-
-        textXml = document.toString(4).toUtf8()
-
-        try:
-            fileXml = open(unicode(filename), 'w')
-            fileXml.write(textXml)
-            fileXml.close()
-        except IOError:
-            raise RuntimeError('Cannot create book file %s' % filename)
-
-        self.filename = filename
-        self.modified = False
-
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    # Loads a book file.
-    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
-    def load(self, filename):
-        try:
-            fileXml = open(unicode(filename), 'r')
-            textXml = fileXml.read()
-            fileXml.close()
-        except IOError:
-            raise RuntimeError('Cannot open book file %s' % filename)
-
-        document = QtXml.QDomDocument()
-
-        if not document.setContent(QtCore.QString.fromUtf8(textXml)):
-            raise RuntimeError('Error parsing book file %s' % filename)
-
-        root = document.documentElement()
-        if root.tagName() != 'book':
-            raise RuntimeError('Unexpected book format in file %s' % filename)
-
-        self.title = root.attribute('title', 'Untitled')
-        self.overwrite = root.attribute('overwrite', 'true' if Book.DefaultOverwrite else 'false') == 'true'
-        self.device = root.attribute('device', Book.DefaultDevice)
-        self.imageFlags = int(root.attribute('imageFlags', str(Book.DefaultImageFlags)))
-        self.cbz = root.attribute('cbz', 'true' if Book.DefaultCBZ else 'false') == 'true'
-        self.filename = filename
-        self.modified = False
-        self.images = []
-
-        items = root.elementsByTagName('image')
-        if items == None:
-            return
-
-        for i in xrange(0, len(items)):
-            item = items.at(i).toElement()
-            if item.hasAttribute('filename'):
-                self.images.append(item.attribute('filename'))
-
 
 class MainWindowBook(QtGui.QMainWindow, Ui_MainWindowBook):
     def __init__(self, filename=None):
@@ -229,7 +70,7 @@ class MainWindowBook(QtGui.QMainWindow, Ui_MainWindowBook):
 
         for url in event.mimeData().urls():
             filename = url.toLocalFile()
-            if self.isImageFile(filename):
+            if self.isImageFile(filename) or archive.isArchiveFile(filename):
                 filenames.append(filename)
             elif os.path.isdir(unicode(filename)):
                 directories.append(filename)
@@ -280,8 +121,11 @@ class MainWindowBook(QtGui.QMainWindow, Ui_MainWindowBook):
 
 
     def onFilesDoubleClick(self, item):
+        # There's nothing that can open a page inside an archive, so open the
+        # archive it's in instead.
+        filename, member = archive.splitSource(unicode(item.text()))
         services = QtGui.QDesktopServices()
-        services.openUrl(QtCore.QUrl.fromLocalFile(item.text()))
+        services.openUrl(QtCore.QUrl.fromLocalFile(filename))
 
 
     def onBookAddFiles(self):
@@ -289,7 +133,7 @@ class MainWindowBook(QtGui.QMainWindow, Ui_MainWindowBook):
             self,
             'Select image file(s) to add',
             self.current_dir,
-            'Image files (*.jpeg *.jpg *.gif *.png);;All files (*.*)'
+            'Image files (*.jpeg *.jpg *.gif *.png *.cbz *.zip);;All files (*.*)'
         )
         if filenames:
             self.addImageFiles(filenames)
@@ -415,78 +259,108 @@ class MainWindowBook(QtGui.QMainWindow, Ui_MainWindowBook):
         except RuntimeError, error:
             QtGui.QMessageBox.critical(self, 'Mangle', str(error))
         else:
-            self.listWidgetFiles.clear()
-            for image in self.book.images:
-                self.listWidgetFiles.addItem(image)
+            self.showImageFiles([])
 
 
-    def shiftImageFile(self, row, delta):
-        validShift = (
-            (delta > 0 and row < self.listWidgetFiles.count() - delta) or
-            (delta < 0 and row >= abs(delta))
-        )
-        if not validShift:
+    def shiftImageFiles(self, delta):
+        rows = self.selectedImageRows()
+        if len(rows) == 0:
             return
 
-        item = self.listWidgetFiles.takeItem(row)
+        moved = self.book.moveImages(rows, delta)
+        if moved != rows:
+            self.book.modified = True
+            self.showImageFiles(moved)
+
 
-        self.listWidgetFiles.insertItem(row + delta, item)
-        self.listWidgetFiles.setItemSelected(item, True)
+    def removeImageFiles(self):
+        rows = self.selectedImageRows()
+        if len(rows) == 0:
+            return
 
+        self.book.removeImages(rows)
         self.book.modified = True
-        self.book.images[row], self.book.images[row + delta] = (
-            self.book.images[row + delta], self.book.images[row]
-        )
+        self.showImageFiles([])
 
 
-    def shiftImageFiles(self, delta):
-        items = self.listWidgetFiles.selectedItems()
-        rows = sorted([self.listWidgetFiles.row(item) for item in items])
+    def selectedImageRows(self):
+        indexes = self.listWidgetFiles.selectionModel().selectedIndexes()
+        return sorted([index.row() for index in indexes])
+
 
-        for row in rows if delta < 0 else reversed(rows):
-            self.shiftImageFile(row, delta)
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Refills the file list from the book and selects the given rows.
+    # For a big book, this is far quicker than moving or taking out
+    # rows of the list one at a time.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def showImageFiles(self, selected):
+        scroll = self.listWidgetFiles.verticalScrollBar().value()
 
+        self.listWidgetFiles.clear()
+        self.listWidgetFiles.addItems(self.book.images)
 
-    def removeImageFiles(self):
-        for item in self.listWidgetFiles.selectedItems():
-            row = self.listWidgetFiles.row(item)
-            self.listWidgetFiles.takeItem(row)
-            self.book.images.remove(item.text())
-            self.book.modified = True
+        # Select each run of neighboring rows as one range, rather than each
+        # row on its own.
+        model = self.listWidgetFiles.model()
+        selection = QtGui.QItemSelection()
+        start = 0
+        while start < len(selected):
+            end = start
+            while end + 1 < len(selected) and selected[end + 1] == selected[end] + 1:
+                end = end + 1
+            selection.select(model.index(selected[start]), model.index(selected[end]))
+            start = end + 1
 
+        selectionModel = self.listWidgetFiles.selectionModel()
+        selectionModel.select(selection, QtGui.QItemSelectionModel.Select)
+        if len(selected) > 0:
+            selectionModel.setCurrentIndex(model.index(selected[0]), QtGui.QItemSelectionModel.NoUpdate)
 
-    def addImageFiles(self, filenames):
-        filenamesListed = []
-        for i in xrange(0, self.listWidgetFiles.count()):
-            filenamesListed.append(self.listWidgetFiles.item(i).text())
+        self.listWidgetFiles.verticalScrollBar().setValue(scroll)
 
-        for filename in filenames:
-            if filename not in filenamesListed:
-                filename = QtCore.QString(filename)
-                self.listWidgetFiles.addItem(filename)
-                self.book.images.append(filename)
-                self.book.modified = True
+
+    def addImageFiles(self, filenames):
+        added = QtCore.QStringList()
+        for filename in self.expandArchives(filenames):
+            filename = QtCore.QString(filename)
+            if self.book.addImage(filename):
+                added.append(filename)
+
+        if len(added) > 0:
+            self.listWidgetFiles.addItems(added)
+            self.book.modified = True
 
 
     def addImageDirs(self, directories):
-        filenames = []
+        # The files are added in batches as the scan finds them, rather than
+        # all at once at the end, so a big library fills in as it goes.
+        scanner = DirectoryScanner()
+        for filenames in scanner.scan([unicode(directory) for directory in directories]):
+            self.addImageFiles(filenames)
+            QtGui.QApplication.processEvents(QtCore.QEventLoop.ExcludeUserInputEvents)
 
-        for directory in directories:
-            for root, subdirs, subfiles in os.walk(unicode(directory)):
-                for filename in subfiles:
-                    path = os.path.join(root, filename)
-                    if self.isImageFile(path):
-                        filenames.append(path)
 
-        self.addImageFiles(filenames)
+    def expandArchives(self, filenames):
+        expanded = []
+
+        for filename in filenames:
+            if not archive.isArchiveFile(filename):
+                expanded.append(filename)
+                continue
+
+            try:
+                expanded.extend(archive.listArchive(filename))
+            except IOError, error:
+                QtGui.QMessageBox.warning(self, 'Mangle', str(error))
+
+        return expanded
 
 
     def isImageFile(self, filename):
-        imageExts = ['.jpeg', '.jpg', '.gif', '.png']
         filename = unicode(filename)
         return (
             os.path.isfile(filename) and
-            os.path.splitext(filename)[1].lower() in imageExts
+            archive.isImageName(filename)
         )
 
 
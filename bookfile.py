@@ -0,0 +1,402 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+from PyQt4 import QtCore, QtXml
+
+from image import ImageFlags, ImageDither, ImageFormat
+from cache import ConversionCache
+
+
+# Gives the element a QXmlStreamReader is on the same attribute(name, default)
+# as a QDomElement, so the settings shared by book and defaults files can be
+# read the same way from either.
+class XmlStreamElement:
+    def __init__(self, reader):
+        self.attributes = reader.attributes()
+
+    def attribute(self, name, default = ''):
+        if self.attributes.hasAttribute(name):
+            return self.attributes.value(name).toString()
+        return QtCore.QString(default)
+
+
+class Book:
+    DefaultDevice = 'Kindle 3'
+    DefaultOverwrite = True
+    DefaultCBZ = False
+    DefaultIncremental = False
+    DefaultImageFlags = ImageFlags.Orient | ImageFlags.Shrink | ImageFlags.Quantize
+    DefaultDither = ImageDither.Diffusion
+    DefaultFormat = ImageFormat.Png
+    DefaultCompressLevel = 6
+    DefaultQuality = 85
+    DefaultWorkers = 0
+    DefaultCache = True
+    DefaultCacheSize = ConversionCache.DefaultMaxSize / (1024 * 1024)
+    DefaultCacheDirectory = ConversionCache.DefaultDirectory
+    DefaultsXML = 'defaults.xml'
+
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Creates an empty book with the settings from the given defaults
+    # file, which is created if it doesn't exist yet. With no defaults
+    # file, the book gets the built-in defaults and nothing is read or
+    # written, which is what you want when running without the GUI.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def __init__(self, defaults = DefaultsXML):
+        self.images = []
+        # How many times each image is in the book, so checking whether one
+        # is doesn't mean searching the whole list. Anything that changes
+        # which images are in the book has to keep this up to date.
+        self.imageIndex = {}
+        self.filename = None
+        self.modified = False
+        self.title = None
+
+        if defaults != None:
+            self.load_defaults(defaults)
+        else:
+            self.reset_defaults()
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Saves the current settings as the defaults.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def save_defaults(self, filename = DefaultsXML):
+        document = QtXml.QDomDocument()
+
+        root = document.createElement('defaults')
+        document.appendChild(root)
+
+        root.setAttribute('overwrite', 'true' if self.overwrite else 'false')
+        root.setAttribute('device', self.device)
+        root.setAttribute('orientImages', 'true' if self.imageFlags & ImageFlags.Orient else 'false')
+        root.setAttribute('shrinkImages', 'true' if self.imageFlags & ImageFlags.Shrink else 'false')
+        root.setAttribute('frameImages', 'true' if self.imageFlags & ImageFlags.Frame else 'false')
+        root.setAttribute('ditherImages', 'true' if self.imageFlags & ImageFlags.Quantize else 'false')
+        root.setAttribute('enlargeImages', 'true' if self.imageFlags & ImageFlags.Enlarge else 'false')
+        root.setAttribute('splitImages', 'true' if self.imageFlags & ImageFlags.Split else 'false')
+        root.setAttribute('rightToLeft', 'true' if self.imageFlags & ImageFlags.RightToLeft else 'false')
+        root.setAttribute('sliceStrips', 'true' if self.imageFlags & ImageFlags.Strips else 'false')
+        root.setAttribute('ditherMethod', self.dither)
+        root.setAttribute('outputFormat', self.outputFormat)
+        root.setAttribute('compressLevel', self.compressLevel)
+        root.setAttribute('quality', self.quality)
+        root.setAttribute('cbz', 'true' if self.cbz else 'false')
+        root.setAttribute('incremental', 'true' if self.incremental else 'false')
+        root.setAttribute('workers', self.workers)
+        root.setAttribute('cache', 'true' if self.cache else 'false')
+        root.setAttribute('cacheSize', self.cacheSize)
+        root.setAttribute('cacheDirectory', self.cacheDirectory)
+
+        textXml = document.toString(4).toUtf8()
+
+        try:
+            fileXml = open(unicode(filename), 'w')
+            fileXml.write(textXml)
+            fileXml.close()
+        except IOError:
+            raise RuntimeError('Cannot create defaults file %s' % filename)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Loads the default settings from a file.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def load_defaults(self, filename = DefaultsXML):
+        try:
+            fileXml = open(unicode(filename), 'r')
+            textXml = fileXml.read()
+            fileXml.close()
+        except IOError:
+            self.reset_defaults()
+            self.save_defaults(filename)
+            return
+
+        document = QtXml.QDomDocument()
+
+        if not document.setContent(QtCore.QString.fromUtf8(textXml)):
+            raise RuntimeError('Error parsing defaults file %s' % filename)
+
+        root = document.documentElement()
+        if root.tagName() != 'defaults':
+            raise RuntimeError('Unexpected defaults format in file %s' % filename)
+
+        self.overwrite = root.attribute('overwrite', 'true' if Book.DefaultOverwrite else 'false') == 'true'
+        self.device = root.attribute('device', Book.DefaultDevice)
+        
+        orient = root.attribute('orientImages', 'true' if Book.DefaultImageFlags & ImageFlags.Orient else 'false') == 'true'
+        split = root.attribute('splitImages', 'true' if Book.DefaultImageFlags & ImageFlags.Split else 'false') == 'true'
+        shrink = root.attribute('shrinkImages', 'true' if Book.DefaultImageFlags & ImageFlags.Shrink else 'false') == 'true'
+        enlarge = root.attribute('enlargeImages', 'true' if Book.DefaultImageFlags & ImageFlags.Enlarge else 'false') == 'true'
+        frame = root.attribute('frameImages', 'true' if Book.DefaultImageFlags & ImageFlags.Frame else 'false') == 'true'
+        dither = root.attribute('ditherImages', 'true' if Book.DefaultImageFlags & ImageFlags.Quantize else 'false') == 'true'
+        rtl = root.attribute('rightToLeft', 'true' if Book.DefaultImageFlags & ImageFlags.RightToLeft else 'false') == 'true'
+        strips = root.attribute('sliceStrips', 'true' if Book.DefaultImageFlags & ImageFlags.Strips else 'false') == 'true'
+        self.imageFlags = (
+            (ImageFlags.Orient if orient else 0) |
+            (ImageFlags.Split if split else 0) |
+            (ImageFlags.Shrink if shrink else 0) |
+            (ImageFlags.Enlarge if enlarge else 0) |
+            (ImageFlags.Frame if frame else 0) |
+            (ImageFlags.Quantize if dither else 0) |
+            (ImageFlags.RightToLeft if rtl else 0) |
+            (ImageFlags.Strips if strips else 0)
+        )
+        
+        self.dither = self.loadDither(root)
+        self.outputFormat, self.compressLevel, self.quality = self.loadEncoding(root)
+        self.cbz = root.attribute('cbz', 'true' if Book.DefaultCBZ else 'false') == 'true'
+        self.incremental = root.attribute('incremental', 'true' if Book.DefaultIncremental else 'false') == 'true'
+        self.loadPerformance(root)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Sets every setting to its built-in default.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def reset_defaults(self):
+        self.device = Book.DefaultDevice
+        self.overwrite = Book.DefaultOverwrite
+        self.imageFlags = Book.DefaultImageFlags
+        self.dither = Book.DefaultDither
+        self.outputFormat = Book.DefaultFormat
+        self.compressLevel = Book.DefaultCompressLevel
+        self.quality = Book.DefaultQuality
+        self.cbz = Book.DefaultCBZ
+        self.incremental = Book.DefaultIncremental
+        self.workers = Book.DefaultWorkers
+        self.cache = Book.DefaultCache
+        self.cacheSize = Book.DefaultCacheSize
+        self.cacheDirectory = Book.DefaultCacheDirectory
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Reads the settings for how exports are run, rather than what
+    # they produce, from a defaults file. These belong to the computer
+    # rather than the book, so they're never saved in book files, and
+    # loading a book leaves them as they are.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def loadPerformance(self, root):
+        # No workers means one for every processor.
+        self.workers, ok = root.attribute('workers', str(Book.DefaultWorkers)).toInt()
+        if not ok or self.workers < 0:
+            self.workers = Book.DefaultWorkers
+
+        self.cache = root.attribute('cache', 'true' if Book.DefaultCache else 'false') == 'true'
+
+        self.cacheSize, ok = root.attribute('cacheSize', str(Book.DefaultCacheSize)).toInt()
+        if not ok or self.cacheSize <= 0:
+            self.cacheSize = Book.DefaultCacheSize
+
+        self.cacheDirectory = unicode(root.attribute('cacheDirectory', Book.DefaultCacheDirectory))
+        if len(self.cacheDirectory) == 0:
+            self.cacheDirectory = Book.DefaultCacheDirectory
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Reads the dithering method from a book or defaults file, falling
+    # back on the default for older files or unknown methods.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def loadDither(self, root):
+        dither = str(root.attribute('ditherMethod', Book.DefaultDither))
+        if dither not in ImageDither.Methods:
+            return Book.DefaultDither
+        return dither
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Reads the output format and its settings from a book or defaults
+    # file. Anything missing or out of range gets the default, so older
+    # files keep exporting plain PNG.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def loadEncoding(self, root):
+        outputFormat = str(root.attribute('outputFormat', Book.DefaultFormat))
+        if outputFormat not in ImageFormat.Formats:
+            outputFormat = Book.DefaultFormat
+
+        compressLevel, ok = root.attribute('compressLevel', str(Book.DefaultCompressLevel)).toInt()
+        if not ok or not 0 <= compressLevel <= 9:
+            compressLevel = Book.DefaultCompressLevel
+
+        quality, ok = root.attribute('quality', str(Book.DefaultQuality)).toInt()
+        if not ok or not 1 <= quality <= 100:
+            quality = Book.DefaultQuality
+
+        return outputFormat, compressLevel, quality
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Saves the current state to a book file.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def save(self, filename):
+        fileXml = QtCore.QFile(unicode(filename))
+        if not fileXml.open(QtCore.QIODevice.WriteOnly | QtCore.QIODevice.Truncate):
+            raise RuntimeError('Cannot create book file %s' % filename)
+
+        # The file is written out as we go, rather than built up as a whole
+        # document first, so saving takes no more memory for a book of tens of
+        # thousands of images than for one of ten. It comes out the same as it
+        # always has, UTF-8 with no XML declaration.
+        writer = QtCore.QXmlStreamWriter(fileXml)
+        writer.setAutoFormatting(True)
+        writer.setAutoFormattingIndent(4)
+
+        writer.writeStartElement('book')
+        writer.writeAttribute('title', self.title)
+        writer.writeAttribute('overwrite', 'true' if self.overwrite else 'false')
+        writer.writeAttribute('device', self.device)
+        writer.writeAttribute('imageFlags', str(self.imageFlags))
+        writer.writeAttribute('ditherMethod', self.dither)
+        writer.writeAttribute('outputFormat', self.outputFormat)
+        writer.writeAttribute('compressLevel', str(self.compressLevel))
+        writer.writeAttribute('quality', str(self.quality))
+        writer.writeAttribute('cbz', 'true' if self.cbz else 'false')
+        writer.writeAttribute('incremental', 'true' if self.incremental else 'false')
+
+        for filenameImg in self.images:
+            writer.writeEmptyElement('image')
+            writer.writeAttribute('filename', filenameImg)
+
+        writer.writeEndDocument()
+        fileXml.close()
+
+        if fileXml.error() != QtCore.QFile.NoError:
+            raise RuntimeError('Cannot create book file %s' % filename)
+
+        self.filename = filename
+        self.modified = False
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Loads a book file.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def load(self, filename):
+        fileXml = QtCore.QFile(unicode(filename))
+        if not fileXml.open(QtCore.QIODevice.ReadOnly):
+            raise RuntimeError('Cannot open book file %s' % filename)
+
+        # Like saving, the file is read a piece at a time rather than as a
+        # whole document. Nothing about the book changes until all of it has
+        # been read, though, so a broken file leaves the book as it was.
+        try:
+            reader = QtCore.QXmlStreamReader(fileXml)
+            while not reader.atEnd() and not reader.isStartElement():
+                reader.readNext()
+
+            if reader.hasError():
+                raise RuntimeError('Error parsing book file %s' % filename)
+            if reader.name().toString() != 'book':
+                raise RuntimeError('Unexpected book format in file %s' % filename)
+
+            root = XmlStreamElement(reader)
+            title = root.attribute('title', 'Untitled')
+            overwrite = root.attribute('overwrite', 'true' if Book.DefaultOverwrite else 'false') == 'true'
+            device = root.attribute('device', Book.DefaultDevice)
+            imageFlags = int(root.attribute('imageFlags', str(Book.DefaultImageFlags)))
+            dither = self.loadDither(root)
+            encoding = self.loadEncoding(root)
+            cbz = root.attribute('cbz', 'true' if Book.DefaultCBZ else 'false') == 'true'
+            incremental = root.attribute('incremental', 'true' if Book.DefaultIncremental else 'false') == 'true'
+
+            images = []
+            while not reader.atEnd():
+                reader.readNext()
+                if reader.isStartElement() and reader.name().toString() == 'image':
+                    attributes = reader.attributes()
+                    if attributes.hasAttribute('filename'):
+                        images.append(attributes.value('filename').toString())
+
+            if reader.hasError():
+                raise RuntimeError('Error parsing book file %s' % filename)
+        finally:
+            fileXml.close()
+
+        self.title = title
+        self.overwrite = overwrite
+        self.device = device
+        self.imageFlags = imageFlags
+        self.dither = dither
+        self.outputFormat, self.compressLevel, self.quality = encoding
+        self.cbz = cbz
+        self.incremental = incremental
+        self.filename = filename
+        self.modified = False
+        self.images = images
+        self.indexImages()
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Rebuilds the index after the list of images has been replaced.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def indexImages(self):
+        self.imageIndex = {}
+        for filename in self.images:
+            key = unicode(filename)
+            self.imageIndex[key] = self.imageIndex.get(key, 0) + 1
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Adds an image to the end of the book, unless it's already in it.
+    # Returns True if it was added.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def addImage(self, filename):
+        key = unicode(filename)
+        if key in self.imageIndex:
+            return False
+
+        self.images.append(filename)
+        self.imageIndex[key] = 1
+        return True
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Removes the images at the given positions, in a single pass over
+    # the book however many there are.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def removeImages(self, rows):
+        removed = set(rows)
+        kept = []
+
+        for row, filename in enumerate(self.images):
+            if row not in removed:
+                kept.append(filename)
+                continue
+
+            # Books saved by older versions could list the same image twice.
+            key = unicode(filename)
+            if self.imageIndex[key] > 1:
+                self.imageIndex[key] -= 1
+            else:
+                del self.imageIndex[key]
+
+        self.images = kept
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Moves the images at the given positions delta places towards the
+    # end of the book (or the start, if it's negative), in one pass
+    # over the book for each place. An image that runs into the start
+    # or end of the book, or into another moving image that already
+    # has, stays where it is. Returns the new positions of the images.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def moveImages(self, rows, delta):
+        moving = [False] * len(self.images)
+        for row in rows:
+            moving[row] = True
+
+        step = 1 if delta > 0 else -1
+        if step > 0:
+            positions = xrange(len(self.images) - 2, -1, -1)
+        else:
+            positions = xrange(1, len(self.images))
+
+        # Going through the book from the end we're moving towards, every
+        # moving image swaps with the one in front of it, unless that one is
+        # stuck too.
+        for i in xrange(abs(delta)):
+            for row in positions:
+                if moving[row] and not moving[row + step]:
+                    self.images[row], self.images[row + step] = self.images[row + step], self.images[row]
+                    moving[row], moving[row + step] = False, True
+
+        return [row for row in xrange(len(self.images)) if moving[row]]
@@ -0,0 +1,185 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import cPickle
+import hashlib
+import tempfile
+
+from archive import absoluteSource, openSource
+
+
+def hashFile(filename):
+    digest = hashlib.sha1()
+
+    hashedFile = openSource(filename)
+    try:
+        for block in iter(lambda: hashedFile.read(1 << 20), ''):
+            digest.update(block)
+    finally:
+        hashedFile.close()
+
+    return digest.hexdigest()
+
+
+def hashData(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+# Keeps the converted pages of every source image we've exported, keyed on
+# the contents of the source file and the settings used to convert it, so
+# exporting the same images again (even under a different book, title or
+# path) just copies the pages we already have.
+#
+# Every entry is its own file, written atomically, so worker processes can
+# read and write the cache at the same time without any locking.
+class ConversionCache:
+    # Bump this whenever a change to image.py changes the pages it produces,
+    # or export.py changes how they're stored, so nothing converted by an
+    # older version gets reused.
+    Version = 3
+
+    DefaultDirectory = os.path.join(os.path.expanduser('~'), '.mangle', 'cache')
+    DefaultMaxSize = 512 * 1024 * 1024
+
+    def __init__(self, directory = DefaultDirectory, maxSize = DefaultMaxSize):
+        self.directory = directory
+        self.maxSize = maxSize
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the key for a source image, given the hash of its
+    # contents, converted with the given settings, which can be
+    # anything with a stable repr().
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def key(self, contentHash, settings):
+        return hashlib.sha1(repr((ConversionCache.Version, contentHash, settings))).hexdigest()
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the hash we stored for a source file's contents, if its
+    # size and modification time are still what they were when we did,
+    # so it doesn't have to be read again. Otherwise, returns None.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def findHash(self, source, size, mtime):
+        try:
+            record = open(self.hashRecord(source), 'rb')
+            try:
+                recordStamp, contentHash = record.read().rsplit(' ', 1)
+            finally:
+                record.close()
+        except (IOError, ValueError):
+            return None
+
+        if recordStamp != self.hashStamp(size, mtime):
+            return None
+        return contentHash
+
+    def storeHash(self, source, size, mtime, contentHash):
+        self.write(self.hashRecord(source), '%s %s' % (self.hashStamp(size, mtime), contentHash))
+
+    def hashRecord(self, source):
+        return self.path('sources', hashlib.sha1(absoluteSource(source).encode('utf-8')).hexdigest())
+
+    def hashStamp(self, size, mtime):
+        return '%r %d' % (mtime, size)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the list of encoded pages stored under a key, or None if
+    # there aren't any.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def get(self, key):
+        entryName = self.path('pages', key)
+
+        try:
+            entry = open(entryName, 'rb')
+            try:
+                pages = cPickle.load(entry)
+            finally:
+                entry.close()
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            return None
+
+        # Touch the entry so trim() knows it's been used recently.
+        try:
+            os.utime(entryName, None)
+        except OSError:
+            pass
+
+        return pages
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Stores a list of encoded pages under a key.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def put(self, key, pages):
+        self.write(self.path('pages', key), cPickle.dumps(pages, cPickle.HIGHEST_PROTOCOL))
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Throws away the least recently used pages until the cache fits
+    # in its maximum size again.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def trim(self):
+        entries = []
+        total = 0
+
+        for root, subdirs, subfiles in os.walk(os.path.join(self.directory, 'pages')):
+            for filename in subfiles:
+                entryName = os.path.join(root, filename)
+                try:
+                    info = os.stat(entryName)
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, entryName))
+                total += info.st_size
+
+        entries.sort()
+        for mtime, size, entryName in entries:
+            if total <= self.maxSize:
+                break
+            try:
+                os.remove(entryName)
+                total -= size
+            except OSError:
+                pass
+
+    def path(self, kind, key):
+        # Spread the entries out over subdirectories so no single directory
+        # gets too big.
+        return os.path.join(self.directory, kind, key[:2], key)
+
+    def write(self, filename, data):
+        directory = os.path.dirname(filename)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                # Someone else may have just created it.
+                if not os.path.isdir(directory):
+                    raise
+
+        # Write to a temporary file first and then move it into place, so
+        # nobody ever sees half an entry.
+        handle, tempName = tempfile.mkstemp(dir=directory)
+        tempFile = os.fdopen(handle, 'wb')
+        try:
+            tempFile.write(data)
+        finally:
+            tempFile.close()
+
+        try:
+            os.rename(tempName, filename)
+        except OSError:
+            # On Windows, we can't replace an existing file. For pages, whoever
+            # got there first wrote the same thing anyway; for a stale source
+            # record, the worst that happens is we hash the file again.
+            os.remove(tempName)
@@ -14,11 +14,95 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import os
+import threading
 from PyQt4 import QtGui, QtCore
 
-import image
-from zipfile import ZipFile, ZIP_DEFLATED
-import StringIO
+from export import BookExporter, ExportProgress
+from cache import ConversionCache
+
+
+# Runs an export on a thread of its own, so converting and writing out pages
+# never holds up the GUI. Everything it has to report is sent back as signals,
+# which Qt delivers on the GUI thread:
+#
+#   imageStarted(index)          before each source image is exported
+#   imageTimed(source, stages)   with the stage timings for a source image
+#   imageExported(index, pages)  once a source image has been written out
+#   imageFailed(index, message)  if a source image couldn't be exported; the
+#                                thread then waits for resume() or abort()
+#   exportFailed(message)        if the export as a whole couldn't go on
+class ExportThread(QtCore.QThread):
+    def __init__(self, book, target):
+        QtCore.QThread.__init__(self)
+
+        self.book = book
+        cache = None
+        if book.cache:
+            cache = ConversionCache(book.cacheDirectory, book.cacheSize * 1024 * 1024)
+
+        # With no workers set, BookExporter uses one for every processor.
+        self.exporter = BookExporter(book, target, book.workers or None, cache, self.timed)
+        self.aborted = False
+        self.resumed = threading.Event()
+
+
+    def run(self):
+        try:
+            try:
+                self.exporter.begin()
+
+                for index in xrange(len(self.book.images)):
+                    if self.aborted:
+                        break
+
+                    self.emit(QtCore.SIGNAL('imageStarted'), index)
+
+                    try:
+                        pages = self.exporter.exportNext()
+                    except RuntimeError, error:
+                        self.resumed.clear()
+                        self.emit(QtCore.SIGNAL('imageFailed'), index, unicode(error))
+                        self.resumed.wait()
+                    else:
+                        self.emit(QtCore.SIGNAL('imageExported'), index, pages)
+            except Exception, error:
+                self.failed(error)
+        finally:
+            # Whether we finished, were aborted, never got started or ran into
+            # something unexpected, shut down the worker processes and finish
+            # off the output.
+            try:
+                self.exporter.close()
+            except Exception, error:
+                self.failed(error)
+
+
+    def failed(self, error):
+        # Anything other than a RuntimeError is a bug, but the user still needs
+        # to know the book wasn't exported properly.
+        if isinstance(error, RuntimeError):
+            message = unicode(error)
+        else:
+            message = u'Unexpected error while exporting: %s: %s' % (error.__class__.__name__, unicode(error))
+        self.emit(QtCore.SIGNAL('exportFailed'), message)
+
+
+    def timed(self, source, stages):
+        self.emit(QtCore.SIGNAL('imageTimed'), source, stages)
+
+
+    def resume(self):
+        self.resumed.set()
+
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Stops the export once the source image being exported now is
+    # done. Anything still waiting in the worker processes is skipped.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def abort(self):
+        self.aborted = True
+        self.resumed.set()
+
 
 class DialogConvert(QtGui.QProgressDialog):
     def __init__(self, parent, book, target):
@@ -26,139 +110,93 @@ class DialogConvert(QtGui.QProgressDialog):
 
         self.book = book
         self.target = str(target)
+        self.failed = False
 
-        self.timer = None
         self.setWindowTitle('Exporting book...')
         self.setMaximum(len(self.book.images))
         self.setValue(0)
-        
-        # Since we can generate multiple images from a single source image,
-        # we use this counter to determine how to name the files.
-        self.counter = 0
+
+        # The dialog has to stay up until the export thread is done, even once
+        # every page is written or the user asks to cancel, so we decide when
+        # it closes rather than leaving that to QProgressDialog.
+        self.setAutoClose(False)
+        self.setAutoReset(False)
+        self.disconnect(self, QtCore.SIGNAL('canceled()'), self, QtCore.SLOT('cancel()'))
+        self.connect(self, QtCore.SIGNAL('canceled()'), self.onCanceled)
+
+        # The thread does the actual work; we just report on its progress.
+        self.progress = ExportProgress(len(self.book.images))
+        self.worker = ExportThread(self.book, self.target)
+        self.connect(self.worker, QtCore.SIGNAL('imageStarted'), self.onImageStarted)
+        self.connect(self.worker, QtCore.SIGNAL('imageTimed'), self.progress.listener)
+        self.connect(self.worker, QtCore.SIGNAL('imageExported'), self.onImageExported)
+        self.connect(self.worker, QtCore.SIGNAL('imageFailed'), self.onImageFailed)
+        self.connect(self.worker, QtCore.SIGNAL('exportFailed'), self.onExportFailed)
+        self.connect(self.worker, QtCore.SIGNAL('finished()'), self.onFinished)
 
 
     def showEvent(self, event):
-        if self.timer == None:
-            self.timer = QtCore.QTimer()
-            self.connect(self.timer, QtCore.SIGNAL('timeout()'), self.onTimer)
-            self.timer.start(0)
+        if not self.worker.isRunning() and not self.worker.isFinished():
+            self.worker.start()
 
 
-    def onTimer(self):
-        index = self.value()
+    def closeEvent(self, event):
+        if self.worker.isRunning():
+            self.onCanceled()
+            event.ignore()
+        else:
+            QtGui.QProgressDialog.closeEvent(self, event)
 
-        out_dir = ""
-        cbz = ""
-        
-        name_template = "%05d.png"
 
-        if self.book.cbz:
-          out_dir = os.path.split(self.target)[0]
-          cbz = self.target
+    def reject(self):
+        if self.worker.isRunning():
+            self.onCanceled()
         else:
-          out_dir = os.path.join(unicode(self.target), unicode(self.book.title))
-        
-        source = unicode(self.book.images[index])
+            QtGui.QProgressDialog.reject(self)
 
-        if index == 0:
-            try:
-                if not os.path.isdir(out_dir):
-                    os.makedirs(out_dir)
-            except OSError:
-                QtGui.QMessageBox.critical(self, 'Mangle', 'Cannot create directory %s' % out_dir)
-                self.close()
-                return
 
-            try:
-                base = os.path.join(out_dir, unicode(self.book.title))
+    def onCanceled(self):
+        self.worker.abort()
+        self.setLabelText('Stopping...')
 
-                # What, exactly, is this for? I never could figure it out.
-                saveData = u'LAST=/mnt/us/pictures/%s/%s' % (self.book.title, name_template % self.counter)
 
-                if not self.book.cbz:
+    def onImageStarted(self, index):
+        source = unicode(self.book.images[index])
+        self.setLabelText('Processing %s...\n%s' % (os.path.split(source)[1], self.progress.status()))
 
-                    mangaName = '%s.manga' % base
-                    mangaSaveName = '%s.manga_save' % base
 
-                    if self.book.overwrite or not os.path.isfile(mangaName):
-                        manga = open(mangaName, 'w')
-                        manga.write('\x00')
-                        manga.close()
+    def onImageExported(self, index, pages):
+        self.progress.advance(pages)
+        self.setValue(index + 1)
 
-                    if self.book.overwrite or not os.path.isfile(mangaSaveName):
-                        mangaSave = open(mangaSaveName, 'w')
-                        mangaSave.write(saveData.encode('utf-8'))
-                        mangaSave.close()
 
-                elif self.book.cbz:
+    def onImageFailed(self, index, message):
+        self.progress.advance()
+        self.setValue(index + 1)
 
-                    mangaName = '%s.manga' % self.book.title
-                    mangaSaveName = '%s.manga_save' % self.book.title
+        result = QtGui.QMessageBox.critical(
+            self,
+            'Mangle',
+            message,
+            QtGui.QMessageBox.Abort | QtGui.QMessageBox.Ignore,
+            QtGui.QMessageBox.Ignore
+        )
+        if result == QtGui.QMessageBox.Abort:
+            self.onCanceled()
+        else:
+            self.worker.resume()
 
-                    if os.path.isfile(cbz):
-                        # If the file already exists, get rid of it before we start writing to it,
-                        # since we open the zip file in append mode.
-                        os.remove(cbz)
-                    cbz_out = ZipFile(cbz, 'a', ZIP_DEFLATED, allowZip64 = True)
-                    cbz_out.writestr(mangaName, '\x00')
-                    cbz_out.writestr(mangaSaveName, saveData.encode('utf-8'))
-                    cbz_out.close()
 
-            except IOError:
-                QtGui.QMessageBox.critical(self, 'Mangle', 'Cannot write manga file(s) to directory %s' % out_dir)
-                self.close()
-                return False
+    def onExportFailed(self, message):
+        self.failed = True
+        QtGui.QMessageBox.critical(self, 'Mangle', message)
 
-        self.setLabelText('Processing %s...' % os.path.split(source)[1])
 
-        try:
-            # Since splitting is an option, we can get multiple files back from
-            # the convert operation, and it'll always be stored in a list.
-            images = image.convertImage(source, str(self.book.device), self.book.imageFlags)
-            # lol cheating
-            #conv_img = images[0]
-            
-            for conv_img in images:
-
-                # If we're exporting to file, we need the full path. Otherwise, we just need the filename.
-                out_file = (
-                    os.path.join(out_dir, name_template % self.counter) if not self.book.cbz 
-                    else (name_template % self.counter)
-                )
-
-                if (self.book.overwrite or not os.path.isfile(out_file)) and not self.book.cbz:
+    def onFinished(self):
+        # finished() can arrive a moment before the thread is fully done.
+        self.worker.wait()
 
-                    try:
-                        conv_img.save(out_file)
-
-                    except IOError:
-                        raise RuntimeError('Cannot write image file %s' % out_file)
-
-                if self.book.cbz:
-                    cbz_out = ZipFile(cbz, 'a', ZIP_DEFLATED, allowZip64 = True)
-
-                    # Write the image in PNG format to an object pretending to be a file, so we can
-                    # dump the string data into the CBZ file without saving to disk first.
-                    out_str = StringIO.StringIO()
-                    conv_img.save(out_str, format='PNG')
-                    cbz_out.writestr(out_file, out_str.getvalue())
-                    out_str.close()
-
-                    cbz_out.close()
-                
-                # We're done with this image, so up the counter.
-                self.counter = self.counter + 1
-                
-        except RuntimeError, error:
-            result = QtGui.QMessageBox.critical(
-                self,
-                'Mangle',
-                str(error),
-                QtGui.QMessageBox.Abort | QtGui.QMessageBox.Ignore,
-                QtGui.QMessageBox.Ignore
-            )
-            if result == QtGui.QMessageBox.Abort:
-                self.close()
-                return
+        if not self.failed and self.progress.done == len(self.book.images):
+            QtGui.QMessageBox.information(self, 'Mangle', self.progress.summary())
 
-        self.setValue(index + 1)
+        self.accept()
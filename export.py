@@ -0,0 +1,742 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+import zlib
+import heapq
+import threading
+from collections import deque
+from timeit import default_timer
+from itertools import imap
+import multiprocessing
+from zipfile import ZipFile, ZipInfo, LargeZipFile, ZIP_DEFLATED, ZIP_STORED, ZIP64_LIMIT
+
+import image
+from archive import openSource, statSource, forgetArchives
+from cache import hashData
+from manifest import ExportManifest
+
+
+# Set in the worker processes once the export has been cut short, so the
+# source images still queued up are skipped instead of converted for nothing.
+cancelled = None
+
+
+def initWorker(event):
+    global cancelled
+    cancelled = event
+
+    # We may have been forked while the exporter was in the middle of reading
+    # from an archive, so don't trust anything we inherited from it.
+    forgetArchives()
+
+
+# Collects what the encoder writes as the list of chunks it was written in.
+# A StringIO would hold on to the same chunks and then join them into one
+# more copy of the page; we never need the page as a single string, since
+# every chunk can be written out as it is.
+class PageChunks:
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(data)
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Converts a single source image and returns its pages already
+# encoded in the book's output format, each as a list of chunks,
+# along with how long each stage took if the job asks for that, and
+# the source's size, modification time and hash if the job needs
+# them for the cache or the manifest (or None if it doesn't, or
+# they couldn't be had). This runs inside the worker processes, so
+# it has to live at module level and hand back something picklable.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def convertSource(job):
+    # Source images we already know are up to date don't need converting,
+    # and neither does anything left over from a cancelled export.
+    if job == None or (cancelled != None and cancelled.is_set()):
+        return None
+
+    source, data, settings, cache, timed, describe = job
+    device, flags, dither, format, compressLevel, quality = settings
+
+    timer = image.StageTimer() if timed else None
+
+    # The source is hashed here, once, from the same contents it's converted
+    # from, rather than read again for the cache and again for the manifest.
+    description = None
+    if describe or cache != None:
+        try:
+            data, description = describeSource(source, data, cache)
+        except (IOError, OSError):
+            description = None
+
+    # If we've converted this exact image with these exact settings before,
+    # the pages are already sitting in the cache. The cache is only ever a
+    # shortcut, so if anything goes wrong with it we just convert as usual.
+    key = None
+    if cache != None and description != None:
+        try:
+            key = cache.key(description[2], settings)
+            pages = cache.get(key)
+            if pages != None:
+                if timer != None:
+                    timer.mark('cache', size=sum([pageSize(chunks) for chunks in pages]))
+                return pages, (timer.stages if timer != None else None), description
+        except (IOError, OSError):
+            key = None
+
+    pages = []
+    for convImg in image.convertImage(source, device, flags, dither, timer, data):
+        outData = PageChunks()
+        image.encodeImage(convImg, outData, device, format, compressLevel, quality)
+        pages.append(outData.chunks)
+        if timer != None:
+            timer.mark('encode', convImg, len(pages) - 1, pageSize(outData.chunks))
+
+    if key != None:
+        try:
+            cache.put(key, pages)
+        except (IOError, OSError):
+            pass
+
+    return pages, (timer.stages if timer != None else None), description
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Returns the contents of a source image to convert it from, which
+# may now have been read in, and its size, modification time and
+# hash. If the cache already knows the hash, the file isn't read for
+# it; otherwise it's read in once, if it hasn't been already, for
+# hashing and converting both.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def describeSource(source, data, cache):
+    size, mtime = statSource(source)
+
+    contentHash = None
+    if cache != None:
+        contentHash = cache.findHash(source, size, mtime)
+
+    if contentHash == None:
+        if data == None:
+            sourceFile = openSource(source)
+            try:
+                data = sourceFile.read()
+            finally:
+                sourceFile.close()
+
+        contentHash = hashData(data)
+
+        if cache != None:
+            try:
+                cache.storeHash(source, size, mtime, contentHash)
+            except (IOError, OSError):
+                pass
+
+    return data, (size, mtime, contentHash)
+
+
+def pageSize(chunks):
+    return sum([len(chunk) for chunk in chunks])
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Adds an entry made up of a list of chunks to a ZIP file, either
+# stored as it is or deflated. This does what ZipFile.writestr()
+# does, but takes the chunks one after another instead of needing
+# them joined into a single string first. It follows the Python 2.7
+# version of writestr() step for step, and relies on the same
+# ZipFile internals it does (fp, _writecheck(), _didModify,
+# _allowZip64, filelist and NameToInfo), so it needs checking
+# against any other version of zipfile.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def writeChunks(archive, name, chunks, compressType = ZIP_STORED):
+    info = ZipInfo(name, time.localtime(time.time())[:6])
+    info.compress_type = compressType
+    info.external_attr = 0600 << 16
+
+    crc = 0
+    size = 0
+    for chunk in chunks:
+        crc = zlib.crc32(chunk, crc)
+        size += len(chunk)
+
+    # The header needs the compressed size, so everything is compressed
+    # before any of it is written.
+    if compressType == ZIP_DEFLATED:
+        compressor = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15)
+        chunks = [compressor.compress(chunk) for chunk in chunks] + [compressor.flush()]
+
+    if not archive.fp:
+        raise RuntimeError('Attempt to write to ZIP archive that was already closed')
+
+    info.CRC = crc & 0xffffffff
+    info.file_size = size
+    info.compress_size = sum([len(chunk) for chunk in chunks])
+    info.header_offset = archive.fp.tell()
+    archive._writecheck(info)
+    archive._didModify = True
+
+    zip64 = info.file_size > ZIP64_LIMIT or info.compress_size > ZIP64_LIMIT
+    if zip64 and not archive._allowZip64:
+        raise LargeZipFile('Filesize would require ZIP64 extensions')
+
+    archive.fp.write(info.FileHeader(zip64))
+    for chunk in chunks:
+        archive.fp.write(chunk)
+    archive.fp.flush()
+
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+
+
+# Reads the source images ahead of the one being converted, on a few
+# background threads, so waiting on the disk (or on the network, for a library
+# kept on a NAS) overlaps with converting and writing out the pages before it.
+# Only so many sources are held in memory at once; the next one isn't read
+# until an earlier one has been taken.
+class SourcePrefetcher:
+    DefaultDepth = 4
+    MaxThreads = 4
+
+    def __init__(self, sources, depth = DefaultDepth):
+        self.sources = sources
+        self.next = 0
+        self.data = {}
+        self.stopped = False
+        self.slots = threading.Semaphore(depth)
+        self.ready = threading.Condition()
+
+        self.threads = []
+        for i in xrange(min(depth, SourcePrefetcher.MaxThreads)):
+            thread = threading.Thread(target=self.run)
+            thread.daemon = True
+            thread.start()
+            self.threads.append(thread)
+
+    def run(self):
+        while True:
+            # Taking a slot before picking a source means the slots are always
+            # held by the earliest sources nobody has taken yet, so we can never
+            # end up waiting on a source that can't get one.
+            self.slots.acquire()
+            self.ready.acquire()
+            try:
+                if self.stopped or self.next >= len(self.sources):
+                    self.slots.release()
+                    return
+                index = self.next
+                self.next = self.next + 1
+            finally:
+                self.ready.release()
+
+            data = None
+            try:
+                data = self.read(self.sources[index])
+            finally:
+                self.ready.acquire()
+                self.data[index] = data
+                self.ready.notifyAll()
+                self.ready.release()
+
+    def read(self, source):
+        # Sources that don't need converting are skipped. If a source can't be
+        # read, whoever converts it will try again and report the error.
+        if source == None:
+            return None
+        try:
+            sourceFile = openSource(source)
+            try:
+                return sourceFile.read()
+            finally:
+                sourceFile.close()
+        except (IOError, OSError):
+            return None
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the contents of a source image, waiting for it to be read
+    # if need be, or None if it was skipped or couldn't be read. Each
+    # source can only be taken once, and in order.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def get(self, index):
+        self.ready.acquire()
+        try:
+            while index not in self.data:
+                # Once stopped, whatever was read but not yet taken is gone,
+                # and nothing more will be, so don't wait on it.
+                if self.stopped:
+                    return None
+                self.ready.wait()
+            data = self.data.pop(index)
+        finally:
+            self.ready.release()
+
+        self.slots.release()
+        return data
+
+    def stop(self):
+        self.ready.acquire()
+        self.stopped = True
+        self.data.clear()
+        self.ready.notifyAll()
+        self.ready.release()
+
+        # Wake up any threads still waiting for a slot, so they can quit.
+        for thread in self.threads:
+            self.slots.release()
+
+
+def defaultWorkers():
+    try:
+        return multiprocessing.cpu_count()
+    except NotImplementedError:
+        return 1
+
+
+# Everything needed to actually write a book out to disk lives here, rather
+# than in the export dialog, so the same code can be driven by the GUI or run
+# from the command line without Qt (or a display) being involved at all.
+class BookExporter:
+    JobsPerWorker = 2
+
+    def __init__(self, book, target, workers = None, cache = None, listener = None, prefetch = SourcePrefetcher.DefaultDepth):
+        self.book = book
+        self.target = unicode(target)
+        self.title = unicode(self.book.title)
+        self.device = str(self.book.device)
+        self.dither = str(self.book.dither)
+        self.format = str(self.book.outputFormat)
+
+        # Everything that affects how a page comes out, other than the source
+        # image itself.
+        self.settings = (
+            self.device, self.book.imageFlags, self.dither,
+            self.format, self.book.compressLevel, self.book.quality
+        )
+
+        self.nameTemplate = '%%05d.%s' % image.ImageFormat.Extensions.get(self.format, self.format)
+
+        # Pages that are already compressed are stored in a CBZ file as they
+        # are, since deflating them again would cost a lot of time for next to
+        # no gain. PNGs saved without compression still need it, though.
+        if self.format == image.ImageFormat.Png and self.book.compressLevel == 0:
+            self.pageCompression = ZIP_DEFLATED
+        else:
+            self.pageCompression = ZIP_STORED
+
+        # Since we can generate multiple images from a single source image,
+        # we use this counter to determine how to name the files.
+        self.counter = 0
+
+        if self.book.cbz:
+            self.outDir = os.path.split(self.target)[0]
+            self.cbz = self.target
+        else:
+            self.outDir = os.path.join(self.target, self.title)
+            self.cbz = None
+
+        # Source images are converted by a pool of worker processes (unless
+        # there's only one worker, in which case we don't bother with a pool)
+        # but always handed back and written out in book order.
+        self.workers = max(1, min(workers or defaultWorkers(), len(self.book.images)))
+
+        # Only so many source images are handed out to be converted ahead of
+        # the one being written out, so a slow disk (or a book of long strips)
+        # can't have converted pages pile up in memory without end.
+        self.slots = threading.Semaphore(self.workers * BookExporter.JobsPerWorker)
+        self.stopping = False
+        self.pool = None
+        self.cancelled = None
+        self.results = None
+        self.remaining = 0
+        self.cbzOut = None
+
+        # An optional ConversionCache, shared with the worker processes.
+        self.cache = cache
+
+        # How many source images to read ahead of the one being converted.
+        # With none, every source is read by whoever converts it.
+        self.prefetch = prefetch
+        self.prefetcher = None
+
+        # If given, this is called as listener(source, stages) once every
+        # source image has been exported. stages lists what happened to it,
+        # from decoding to writing out, as dicts with the name of the stage,
+        # the page it worked on (None for the whole image), how long it
+        # took, how many pixels it produced and how many bytes it wrote.
+        # Nothing gets timed at all without a listener.
+        self.listener = listener
+
+        # Incremental exports only make sense for directories, since a CBZ file
+        # is always written from scratch.
+        self.manifest = None
+        if self.book.incremental and not self.book.cbz:
+            self.manifest = ExportManifest(os.path.join(self.outDir, '%s.manifest' % self.title), self.settings)
+        self.sources = [unicode(source) for source in self.book.images]
+        self.unchanged = [None] * len(self.sources)
+        self.index = 0
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Creates the output directory and writes the .manga and
+    # .manga_save files. Must be called before any pages are exported.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def begin(self):
+        if not image.formatSupported(self.format):
+            raise RuntimeError('Cannot save images as %s with this installation of PIL' % self.format)
+
+        try:
+            if self.outDir and not os.path.isdir(self.outDir):
+                os.makedirs(self.outDir)
+        except OSError:
+            raise RuntimeError('Cannot create directory %s' % self.outDir)
+
+        try:
+            base = os.path.join(self.outDir, self.title)
+
+            # What, exactly, is this for? I never could figure it out.
+            saveData = u'LAST=/mnt/us/pictures/%s/%s' % (self.title, self.nameTemplate % self.counter)
+
+            if not self.book.cbz:
+
+                mangaName = '%s.manga' % base
+                mangaSaveName = '%s.manga_save' % base
+
+                if self.book.overwrite or not os.path.isfile(mangaName):
+                    manga = open(mangaName, 'w')
+                    manga.write('\x00')
+                    manga.close()
+
+                if self.book.overwrite or not os.path.isfile(mangaSaveName):
+                    mangaSave = open(mangaSaveName, 'w')
+                    mangaSave.write(saveData.encode('utf-8'))
+                    mangaSave.close()
+
+            else:
+
+                mangaName = '%s.manga' % self.title
+                mangaSaveName = '%s.manga_save' % self.title
+
+                # The archive stays open for the whole export and is only closed
+                # (and its central directory written) once, in close().
+                self.cbzOut = ZipFile(self.cbz, 'w', ZIP_DEFLATED, allowZip64 = True)
+                self.cbzOut.writestr(mangaName, '\x00')
+                self.cbzOut.writestr(mangaSaveName, saveData.encode('utf-8'))
+
+        except (IOError, OSError):
+            raise RuntimeError('Cannot write manga file(s) to directory %s' % self.outDir)
+
+        # For an incremental export, source images that haven't changed since
+        # the last one don't get sent off to be converted at all.
+        if self.manifest != None:
+            self.manifest.load()
+            self.unchanged = [self.manifest.findUnchanged(source) for source in self.sources]
+
+        # The jobs are only made as they're handed out, so each one can take
+        # its source image from the prefetcher once it's been read.
+        queued = [
+            source if entry == None else None
+            for source, entry in zip(self.sources, self.unchanged)
+        ]
+        # The worker processes are started before any prefetching threads, so
+        # they can't be forked while one of those is in the middle of reading.
+        if self.workers > 1:
+            self.cancelled = multiprocessing.Event()
+            self.pool = multiprocessing.Pool(self.workers, initWorker, (self.cancelled,))
+
+        if self.prefetch > 0:
+            self.prefetcher = SourcePrefetcher(queued, self.prefetch)
+
+        jobs = imap(self.makeQueuedJob, xrange(len(queued)), queued)
+        self.remaining = len(queued)
+
+        if self.pool != None:
+            self.results = self.pool.imap(convertSource, jobs)
+        else:
+            self.results = imap(convertSource, jobs)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Waits for the next source image of the book to be converted and
+    # writes out every page generated from it. Returns the number of
+    # pages written. A RuntimeError only affects the current source
+    # image, so it's safe to carry on with the next one afterwards.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def exportNext(self):
+        index = self.index
+        self.index = self.index + 1
+        self.remaining = self.remaining - 1
+
+        # Since splitting is an option, we can get multiple pages back from
+        # the convert operation, and it'll always be stored in a list.
+        try:
+            result = self.results.next()
+        finally:
+            self.slots.release()
+
+        if result == None:
+            # The source image hasn't changed. If its pages are still where
+            # they'd go now, we're done with it. If an earlier image changed
+            # how many pages it makes, though, they need to move, so it gets
+            # converted after all.
+            entry = self.unchanged[index]
+            if self.manifest.isExported(entry, self.counter, self.outDir, self.nameTemplate):
+                self.manifest.keep(entry)
+                self.counter = self.counter + entry['count']
+                if self.listener != None:
+                    self.listener(self.sources[index], [])
+                return entry['count']
+
+            result = convertSource(self.makeJob(self.sources[index]))
+
+        pages, stages, description = result
+
+        timer = image.StageTimer() if self.listener != None else None
+        start = self.counter
+        for data in pages:
+            self.writePage(data)
+            if timer != None:
+                timer.mark('write', page=self.counter - start - 1, size=pageSize(data))
+
+        if self.manifest != None:
+            self.manifest.add(self.sources[index], start, len(pages), description)
+
+        if self.listener != None:
+            self.listener(self.sources[index], stages + timer.stages)
+
+        return len(pages)
+
+    def makeJob(self, source, data = None):
+        return (source, data, self.settings, self.cache, self.listener != None, self.manifest != None)
+
+    def makeQueuedJob(self, index, source):
+        self.slots.acquire()
+        if self.stopping:
+            # Let whoever is next in line through too.
+            self.slots.release()
+            return None
+
+        if source == None:
+            return None
+        return self.makeJob(source, self.prefetcher.get(index) if self.prefetcher != None else None)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Writes one encoded page, as a list of chunks, out under the next
+    # page number.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def writePage(self, chunks):
+        name = self.nameTemplate % self.counter
+
+        if not self.book.cbz:
+            # If we're exporting to file, we need the full path. Otherwise, we just need the filename.
+            outFile = os.path.join(self.outDir, name)
+
+            # In an incremental export, we only get here for pages that changed.
+            if self.book.overwrite or self.manifest != None or not os.path.isfile(outFile):
+                try:
+                    out = open(outFile, 'wb')
+                    out.writelines(chunks)
+                    out.close()
+                except IOError:
+                    raise RuntimeError('Cannot write image file %s' % outFile)
+
+        else:
+            try:
+                writeChunks(self.cbzOut, name, chunks, self.pageCompression)
+            except (IOError, LargeZipFile):
+                raise RuntimeError('Cannot write image file %s to %s' % (name, self.cbz))
+
+        # We're done with this page, so up the counter.
+        self.counter = self.counter + 1
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Shuts down the worker processes and finishes off the CBZ file.
+    # If the export was cut short, any conversions still in flight are
+    # thrown away, but the pages written so far are kept.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def close(self):
+        # Whatever hasn't been taken from the prefetcher yet won't be now, and
+        # nothing more is waiting for its turn to be converted.
+        if self.prefetcher != None:
+            self.prefetcher.stop()
+
+        self.stopping = True
+        self.slots.release()
+
+        if self.pool != None:
+            # Pool.terminate() can hang for good if it kills a worker halfway
+            # through sending back its pages. So instead, the workers are told
+            # to skip whatever's still queued, and we only wait for the images
+            # they're converting right now.
+            if self.remaining > 0:
+                self.cancelled.set()
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+        self.results = None
+
+        if self.cache != None:
+            self.cache.trim()
+
+        if self.manifest != None:
+            manifest = self.manifest
+            self.manifest = None
+            self.saveManifest(manifest)
+
+        if self.cbzOut != None:
+            try:
+                self.cbzOut.close()
+            except IOError:
+                raise RuntimeError('Cannot write %s' % self.cbz)
+            finally:
+                self.cbzOut = None
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Writes out the manifest for the next incremental export, and
+    # removes any pages left over from when the book was longer.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def saveManifest(self, manifest):
+        try:
+            stale = manifest.save(self.counter, self.remaining <= 0)
+        except IOError:
+            raise RuntimeError('Cannot write manifest file %s' % manifest.filename)
+
+        for counter in stale:
+            outFile = os.path.join(self.outDir, self.nameTemplate % counter)
+            try:
+                if os.path.isfile(outFile):
+                    os.remove(outFile)
+            except OSError:
+                raise RuntimeError('Cannot remove old image file %s' % outFile)
+
+
+def formatSize(size):
+    return '%.1f MB' % (size / 1048576.0)
+
+
+def formatDuration(seconds):
+    seconds = int(seconds)
+    return '%d:%02d:%02d' % (seconds / 3600, seconds / 60 % 60, seconds % 60)
+
+
+# Keeps track of how fast an export is going, for the progress dialog and the
+# command line to report on. Pass its listener() to the BookExporter, and call
+# advance() every time a source image is done with, with the number of pages
+# exported from it, or with nothing if it failed.
+class ExportProgress:
+    # How many of the most recent images the time left is estimated from, so
+    # it follows the book as it goes from, say, small pages to big spreads.
+    Window = 10
+    SlowestCount = 5
+
+    def __init__(self, total):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.pages = 0
+        self.bytesRead = 0
+        self.bytesWritten = 0
+        self.slowest = []
+
+        self.start = default_timer()
+        self.last = self.start
+        self.recent = deque(maxlen=ExportProgress.Window)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Takes the stage timings for a source image from the exporter.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def listener(self, source, stages):
+        seconds = 0.0
+        pages = 0
+
+        for stage in stages:
+            seconds += stage['seconds']
+            # A strip is decoded a page at a time, but only read once.
+            if stage['stage'] == 'decode' and stage['page'] in (None, 0):
+                try:
+                    self.bytesRead += statSource(source)[0]
+                except (IOError, OSError):
+                    pass
+            elif stage['stage'] == 'cache':
+                self.bytesRead += stage['bytes']
+            elif stage['stage'] == 'write':
+                self.bytesWritten += stage['bytes']
+                pages += 1
+
+        # Images left alone by an incremental export didn't cost anything.
+        if stages:
+            self.slowest.append((seconds, source, pages))
+            self.slowest = heapq.nlargest(ExportProgress.SlowestCount, self.slowest)
+
+    def advance(self, pages = None):
+        now = default_timer()
+        self.recent.append(now - self.last)
+        self.last = now
+        self.done += 1
+
+        if pages == None:
+            self.failed += 1
+        else:
+            self.pages += pages
+
+    def elapsed(self):
+        return default_timer() - self.start
+
+    def remaining(self):
+        if not self.recent:
+            return None
+        return sum(self.recent) / len(self.recent) * (self.total - self.done)
+
+    def rate(self, amount):
+        elapsed = self.elapsed()
+        return amount / elapsed if elapsed > 0 else 0.0
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns a one-line report on how the export is going so far.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def status(self):
+        remaining = self.remaining()
+        return '%d pages, %.1f pages/s, read %s/s, wrote %s/s, %s elapsed, %s' % (
+            self.pages,
+            self.rate(self.pages),
+            formatSize(self.rate(self.bytesRead)),
+            formatSize(self.rate(self.bytesWritten)),
+            formatDuration(self.elapsed()),
+            'about %s left' % formatDuration(remaining) if remaining != None else 'estimating time left'
+        )
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns a report on the whole export, once it's finished.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def summary(self):
+        lines = [
+            'Exported %d pages from %d images in %s (%.1f pages/s).' % (
+                self.pages, self.done - self.failed, formatDuration(self.elapsed()), self.rate(self.pages)),
+            'Read %s (%s/s), wrote %s (%s/s).' % (
+                formatSize(self.bytesRead), formatSize(self.rate(self.bytesRead)),
+                formatSize(self.bytesWritten), formatSize(self.rate(self.bytesWritten)))
+        ]
+
+        if self.failed:
+            lines.append('%d %s could not be exported.' % (self.failed, 'image' if self.failed == 1 else 'images'))
+
+        if self.slowest:
+            lines.append('Slowest images:')
+            for seconds, source, pages in self.slowest:
+                lines.append(u'  %.2f s  %s (%d %s)' % (
+                    seconds, os.path.split(source)[1], pages, 'page' if pages == 1 else 'pages'))
+
+        return u'\n'.join(lines)
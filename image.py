@@ -17,6 +17,19 @@
 from PIL import Image, ImageDraw
 
 import math
+import zlib
+import struct
+import cStringIO
+from timeit import default_timer
+
+from archive import openSource
+
+# NumPy is only needed for ordered dithering. Without it, we just fall back to
+# error diffusion.
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 class ImageFlags:
     Orient = 1 << 0
@@ -27,6 +40,155 @@ class ImageFlags:
     Enlarge = 1 << 4
     Split = 1 << 5
     RightToLeft = 1 << 6
+    Strips = 1 << 7
+
+class ImageDither:
+    Off = 'none'
+    Ordered = 'ordered'
+    Diffusion = 'diffusion'
+
+    Methods = [Diffusion, Ordered, Off]
+
+class ImageFormat:
+    Png = 'png'
+    Jpeg = 'jpeg'
+    WebP = 'webp'
+
+    Formats = [Png, Jpeg, WebP]
+
+    Extensions = {Png: 'png', Jpeg: 'jpg', WebP: 'webp'}
+    Encoders = {Png: 'PNG', Jpeg: 'JPEG', WebP: 'WEBP'}
+
+class DeviceProfile:
+    def __init__(self, size, palette, color = False):
+        self.size = size
+        self.palette = palette
+        self.color = color
+
+        # E-ink devices can only show shades of gray, so their images are
+        # processed in grayscale from the start.
+        self.mode = 'RGB' if color else 'L'
+
+        # The first/last colors in the palettes defined refer to black and
+        # white, which we use for the frame. Grayscale images just need the
+        # one channel.
+        if color:
+            self.foreground = tuple(palette[:3])
+            self.background = tuple(palette[-3:])
+        else:
+            self.foreground = palette[0]
+            self.background = palette[-1]
+
+        # Everything above is the same for every page we convert, so the
+        # palette and lookup table used for quantizing are only built once, too.
+        self.paletteData = padPalette(palette)
+        self.paletteBits = paletteBits(palette)
+        self.paletteImage = Image.new('P', (1, 1))
+        self.paletteImage.putpalette(self.paletteData)
+        self.grayTable = makeGrayTable(palette, self.paletteImage)
+        self.ditherTables = makeDitherTables(palette)
+
+
+# Collects how long each step of converting an image takes, and how big the
+# image was at that point, for anyone who wants to know where the time goes.
+# It only gets used if one is handed to convertImage(), so normally nothing is
+# timed at all.
+class StageTimer:
+    def __init__(self):
+        self.stages = []
+        self.last = default_timer()
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Records that a stage just finished, with the image it produced
+    # and, for stages that write something out, how many bytes it was.
+    # page is None for stages that work on the whole source image.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def mark(self, stage, image = None, page = None, size = None):
+        now = default_timer()
+        self.stages.append({
+            'stage': stage,
+            'page': page,
+            'seconds': now - self.last,
+            'pixels': image.size[0] * image.size[1] if image != None else None,
+            'bytes': size
+        })
+        self.last = now
+
+
+def padPalette(palette):
+    colors = len(palette) / 3
+    if colors < 256:
+        palette = palette + palette[:3] * (256 - colors)
+
+    return palette
+
+
+def paletteBits(palette):
+    # PNG can store palette images with 1, 2, 4 or 8 bits per pixel.
+    colors = len(palette) / 3
+    for bits in (1, 2, 4):
+        if colors <= 1 << bits:
+            return bits
+    return 8
+
+
+def makeGrayTable(palette, palImg):
+    # This only works if every color in the palette is a shade of gray.
+    grays = palette[0::3]
+    if grays != palette[1::3] or grays != palette[2::3]:
+        return None
+
+    # For every possible gray level, the index of the palette entry PIL would
+    # pick for it. PIL's search isn't quite a plain nearest-gray match, so we
+    # ask it directly rather than doing the math ourselves, which keeps the
+    # table in agreement with quantize().
+    ramp = Image.new('L', (256, 1))
+    ramp.putdata(range(256))
+
+    return list(ramp.convert('RGB').quantize(palette=palImg, dither=Image.NONE).getdata())
+
+
+def makeDitherTables(palette):
+    grays = palette[0::3]
+    if numpy == None or grays != palette[1::3] or grays != palette[2::3]:
+        return None
+
+    # For every possible gray level, the indices of the palette grays just
+    # below (or equal to) and just above it, and how far along it is between
+    # the two, in 64ths to match the 8x8 threshold matrix.
+    order = sorted(range(len(grays)), key=lambda i: grays[i])
+    lower = numpy.zeros(256, numpy.uint8)
+    upper = numpy.zeros(256, numpy.uint8)
+    level = numpy.zeros(256, numpy.uint8)
+
+    for value in range(256):
+        below = [i for i in order if grays[i] <= value]
+        above = [i for i in order if grays[i] > value]
+
+        lower[value] = below[-1] if below else order[0]
+        upper[value] = above[0] if above and below else lower[value]
+
+        if upper[value] != lower[value]:
+            low, high = grays[lower[value]], grays[upper[value]]
+            level[value] = int(round(64.0 * (value - low) / (high - low)))
+
+    return lower, upper, level
+
+
+def makeBayerMatrix(order):
+    # Each step builds a matrix twice the size out of four copies of the
+    # previous one, so neighboring thresholds are as far apart as possible.
+    matrix = numpy.zeros((1, 1), numpy.uint8)
+    for i in range(order):
+        matrix = numpy.vstack((
+            numpy.hstack((4 * matrix, 4 * matrix + 2)),
+            numpy.hstack((4 * matrix + 3, 4 * matrix + 1))
+        ))
+    return matrix
+
+
+BayerMatrix = makeBayerMatrix(3) if numpy != None else None
+
 
 class KindleData:
     Palette4 = [
@@ -55,25 +217,62 @@ class KindleData:
     ]
 
     Profiles = {
-        'Kindle 1': ((600, 800), Palette4),
-        'Kindle 2': ((600, 800), Palette15),
-        'Kindle 3': ((600, 800), Palette15),
-        'Kindle DX': ((824, 1200), Palette15),
-        'Kindle DXG': ((824, 1200), Palette15),
-        'nook': ((600, 730), Palette15),
-        'nook color': ((600, 980), Palette15)
+        'Kindle 1': DeviceProfile((600, 800), Palette4),
+        'Kindle 2': DeviceProfile((600, 800), Palette15),
+        'Kindle 3': DeviceProfile((600, 800), Palette15),
+        'Kindle DX': DeviceProfile((824, 1200), Palette15),
+        'Kindle DXG': DeviceProfile((824, 1200), Palette15),
+        'nook': DeviceProfile((600, 730), Palette15),
+        'nook color': DeviceProfile((600, 980), Palette15, True)
     }
 
 
-def quantizeImage(image, palette):
-    colors = len(palette) / 3
-    if colors < 256:
-        palette = palette + palette[:3] * (256 - colors)
+def orderedDitherImage(image, profile):
+    lower, upper, level = profile.ditherTables
+
+    # Each pixel is rounded up to the next palette gray if it's further along
+    # towards it than the threshold for its position, and down otherwise.
+    # Unlike error diffusion, no pixel depends on any other, so the whole
+    # page is done in one go.
+    pixels = numpy.asarray(image)
+    height, width = pixels.shape
+    size = len(BayerMatrix)
+    threshold = numpy.tile(BayerMatrix, (-(-height // size), -(-width // size)))[:height, :width]
+
+    indices = numpy.where(level.take(pixels) > threshold, upper.take(pixels), lower.take(pixels))
+
+    image = Image.fromarray(indices, 'L')
+    image.putpalette(profile.paletteData)
+    return image
 
-    palImg = Image.new('P', (1, 1))
-    palImg.putpalette(palette)
 
-    return image.quantize(palette=palImg)
+def quantizeImage(image, profile, dither = ImageDither.Diffusion):
+    if dither == ImageDither.Ordered and profile.ditherTables != None:
+        if image.mode != 'L':
+            image = image.convert('L')
+        return orderedDitherImage(image, profile)
+
+    # Without dithering, every gray pixel simply becomes the nearest gray in
+    # the palette, so a lookup table does the same job as PIL's nearest
+    # color search in a fraction of the time.
+    if dither == ImageDither.Off and image.mode == 'L' and profile.grayTable != None:
+        image = image.point(profile.grayTable)
+        # Attaching a palette turns the image of indices into a 'P' image.
+        image.putpalette(profile.paletteData)
+        return image
+
+    # PIL only searches the palette for the nearest color with RGB images.
+    # A grayscale image would have its gray levels used as palette indices
+    # as-is, so it has to be expanded first. By now it's been shrunk down to
+    # the device's size, so this is cheap.
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    # Anything we can't do ourselves gets PIL's error diffusion.
+    return image.quantize(
+        palette=profile.paletteImage,
+        dither=Image.NONE if dither == ImageDither.Off else Image.FLOYDSTEINBERG
+    )
 
 
 def resizeImage(image, size, shrink, enlarge):
@@ -113,17 +312,22 @@ def resizeImage(image, size, shrink, enlarge):
         return image.resize((widthNew, heightNew), Image.BICUBIC)
 
 
-def formatImage(image):
-    if image.mode == 'RGB':
+def formatImage(image, mode):
+    if image.mode == mode:
         return image
-    return image.convert('RGB')
+    return image.convert(mode)
 
 
-def orientImage(image, size):
+def orientImage(image, size, rotate = None):
     widthDev, heightDev = size
     widthImg, heightImg = image.size
 
-    if (widthImg > heightImg) != (widthDev > heightDev):
+    # Whether to rotate can be decided up front, from the source image, in
+    # case it's been resized since and rounding has made it square.
+    if rotate == None:
+        rotate = (widthImg > heightImg) != (widthDev > heightDev)
+
+    if rotate:
         # Since a 90-degree rotation is easy, meaning we don't need to do any
         # filtering, just use the transpose version, to be explicit.
         return image.transpose(Image.ROTATE_90)
@@ -184,7 +388,7 @@ def frameImage(image, foreground, background, size):
     return imageBg
 
 
-def splitImage(image, size, rtl = True):
+def splitImage(image, size, rtl = True, numPages = None):
     widthDev, heightDev = size
     widthImg, heightImg = image.size
     
@@ -205,7 +409,11 @@ def splitImage(image, size, rtl = True):
     # If the image has a smaller aspect ratio, this will be 1.
     # We use the ceiling because, if we used the floor, the new images would
     # end up still wider than the device.
-    numPages = int(math.ceil(float(aspectImg) / float(aspectDev)))
+    # The number of pages can also be worked out up front, from the source
+    # image, since after shrinking, rounding can tip an image that's only
+    # just too wide back under the device's aspect ratio.
+    if numPages == None:
+        numPages = int(math.ceil(float(aspectImg) / float(aspectDev)))
     
     # The list of images we'll be returning. Even if we don't split anything,
     # everything else has to assume they'll be getting multiple images.
@@ -245,23 +453,342 @@ def splitImage(image, size, rtl = True):
     
     return images
     
-def convertImage(source, device, flags):
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Makes the same decisions orientImage() and splitImage() would for
+# an image of the given size: whether it gets rotated, and how many
+# pages it gets split into.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def pageLayout(sizeImg, size, orient, split):
+    widthDev, heightDev = size
+    widthImg, heightImg = sizeImg
+
+    rotate = bool(orient) and (widthImg > heightImg) != (widthDev > heightDev)
+    if rotate:
+        widthImg, heightImg = heightImg, widthImg
+
+    numPages = 1
+    if split:
+        aspectDev = float(widthDev) / float(heightDev)
+        aspectImg = float(widthImg) / float(heightImg)
+        numPages = int(math.ceil(aspectImg / aspectDev))
+
+    return rotate, numPages
+
+
+def fitSize(image, size, orient, split, layout = None):
+    widthDev, heightDev = size
+
+    # Work out the box the whole image has to fit in for every page made from
+    # it to fit on the device. The box is in terms of the image as it is now,
+    # before any rotating.
+    if layout == None:
+        layout = pageLayout(image.size, size, orient, split)
+    rotate, numPages = layout
+
+    # Each of the split pages gets the full device width to itself.
+    widthDev = widthDev * numPages
+
+    if rotate:
+        return heightDev, widthDev
+
+    return widthDev, heightDev
+
+
+def draftImage(image, mode, size, shrink, orient, split):
+    widthImg, heightImg = image.size
+
+    # Even if we're not shrinking, JPEGs can still be decoded straight to
+    # grayscale, which saves converting them afterwards.
+    if not shrink:
+        image.draft(mode, image.size)
+        return image
+
+    # Only the header has been read at this point, so this is cheap.
+    widthFit, heightFit = fitSize(image, size, orient, split)
+
+    scale = min(float(widthFit) / float(widthImg), float(heightFit) / float(heightImg))
+    if scale >= 1.0:
+        image.draft(mode, image.size)
+        return image
+
+    # For JPEGs, this lets the decoder do most of the shrinking for us by only
+    # decoding at 1/2, 1/4 or 1/8 scale. It never goes below the requested
+    # size, so resizeImage() still does the final, high quality resize.
+    # Other formats just ignore it.
+    image.draft(mode, (
+        int(math.ceil(widthImg * scale)),
+        int(math.ceil(heightImg * scale))
+    ))
+
+    return image
+
+
+# Reads a PNG a band of rows at a time, so a very tall strip never has to be
+# decoded all at once. The image data is only inflated as far as the rows
+# asked for, and PIL's own PNG decoder turns those into an image. Every row
+# can be filtered against the one above it, so each band after the first is
+# handed over with the last row of the band before in front of it, stored
+# unfiltered, and that row is cropped off again afterwards. Only plain 8-bit,
+# non-interlaced PNGs can be read like this.
+class PngStripReader:
+    Signature = '\x89PNG\r\n\x1a\n'
+    Modes = {0: 'L', 2: 'RGB', 3: 'P', 4: 'LA', 6: 'RGBA'}
+    Channels = {'L': 1, 'RGB': 3, 'P': 1, 'LA': 2, 'RGBA': 4}
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.size = None
+        self.mode = None
+        self.palette = None
+        self.inflater = zlib.decompressobj()
+        self.compressed = ''
+        self.previous = None
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Reads everything up to the start of the image data. Returns
+    # False if this isn't a PNG we can read a band at a time.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def open(self):
+        self.stream.seek(0)
+        if self.stream.read(8) != PngStripReader.Signature:
+            return False
+
+        while True:
+            kind, data = self.readChunk()
+            if kind == 'IHDR':
+                width, height, depth, color, compression, filtering, interlace = struct.unpack('>IIBBBBB', data[:13])
+                if depth != 8 or interlace != 0 or color not in PngStripReader.Modes:
+                    return False
+                self.size = width, height
+                self.mode = PngStripReader.Modes[color]
+            elif kind == 'PLTE':
+                self.palette = data
+            elif kind == 'IDAT':
+                self.compressed = data
+                return self.size != None
+            elif kind == None or kind == 'IEND':
+                return False
+
+    def readChunk(self):
+        header = self.stream.read(8)
+        if len(header) < 8:
+            return None, None
+
+        length, kind = struct.unpack('>I4s', header)
+        data = self.stream.read(length)
+        # Skip the CRC.
+        self.stream.read(4)
+
+        return kind, data
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the next band of rows of the image.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def read(self, rows):
+        width = self.size[0]
+        stride = width * PngStripReader.Channels[self.mode] + 1
+
+        data = []
+        needed = rows * stride
+        while needed > 0:
+            if not self.compressed:
+                kind, self.compressed = self.readChunk()
+                if kind != 'IDAT':
+                    raise IOError('Truncated PNG image data')
+            block = self.inflater.decompress(self.compressed, needed)
+            self.compressed = self.inflater.unconsumed_tail
+            data.append(block)
+            needed -= len(block)
+
+        first = 0
+        if self.previous != None:
+            data.insert(0, '\x00' + self.previous)
+            first = 1
+
+        # Storing the rows without compressing them is hardly more than a copy.
+        try:
+            band = Image.frombytes(self.mode, (width, first + rows), zlib.compress(''.join(data), 0), 'zip', self.mode)
+        except ValueError:
+            raise IOError('Cannot decode PNG image data')
+
+        self.previous = band.crop((0, first + rows - 1, width, first + rows)).tobytes()
+        if first:
+            band = band.crop((0, first, width, first + rows))
+        if self.palette != None:
+            band.putpalette(self.palette)
+
+        return band
+
+
+# Hands out the bands of an image that has to be decoded all at once anyway.
+class ImageStripReader:
+    def __init__(self, image):
+        self.image = image
+        self.size = image.size
+        self.top = 0
+
+    def read(self, rows):
+        band = self.image.crop((0, self.top, self.size[0], self.top + rows))
+        self.top += rows
+        return band
+
+
+def isStrip(image, size):
+    widthDev, heightDev = size
+    widthImg, heightImg = image.size
+
+    # Anything at least two screens tall once it's as wide as the screen is
+    # meant to be scrolled through, not looked at all at once.
+    return heightImg * widthDev >= 2 * widthImg * heightDev
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Cuts a tall strip into pages as tall as the device's screen, once
+# it's been resized to the screen's width. Each page is read from
+# the source, converted and handed out before the next is read, so
+# for PNGs, only one page of the strip is ever in memory.
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def sliceStrip(source, image, stream, profile, flags, dither = ImageDither.Diffusion, timer = None):
+    widthDev, heightDev = profile.size
+    shrink = flags & ImageFlags.Shrink
+    enlarge = flags & ImageFlags.Enlarge
+
+    reader = PngStripReader(stream)
+    try:
+        streamed = image.format == 'PNG' and reader.open()
+    except IOError:
+        raise RuntimeError('Cannot read image file %s' % source)
+
+    if not streamed:
+        # Anything else has to be decoded in one go, but JPEGs can at least
+        # be decoded straight to grayscale, and at a fraction of their size.
+        widthImg, heightImg = image.size
+        if shrink and widthImg > widthDev:
+            scale = float(widthDev) / float(widthImg)
+            image.draft(profile.mode, (int(math.ceil(widthImg * scale)), int(math.ceil(heightImg * scale))))
+        else:
+            image.draft(profile.mode, image.size)
+
+        try:
+            image.load()
+        except (IOError, ValueError):
+            raise RuntimeError('Cannot read image file %s' % source)
+        if timer != None:
+            timer.mark('decode', image)
+        reader = ImageStripReader(image)
+
+    widthImg, heightImg = reader.size
+
+    scale = 1.0
+    if (widthImg > widthDev and shrink) or (widthImg < widthDev and enlarge):
+        scale = float(widthDev) / float(widthImg)
+    widthNew = int(round(widthImg * scale))
+
+    # The pages are cut on whole rows of the source, with the rounding spread
+    # out over all of them. The last page takes whatever is left, so it may
+    # be shorter than the rest.
+    pageRows = heightDev / scale
+    numPages = max(1, int(math.ceil(heightImg / pageRows - 0.01)))
+
+    top = 0
+    for x in range(numPages):
+        bottom = heightImg if x == numPages - 1 else int(round((x + 1) * pageRows))
+
+        try:
+            page = reader.read(bottom - top)
+        except IOError:
+            raise RuntimeError('Cannot read image file %s' % source)
+        if timer != None and streamed:
+            timer.mark('decode', page, x)
+
+        page = formatImage(page, profile.mode)
+        if timer != None:
+            timer.mark('format', page, x)
+
+        heightNew = max(1, int(round((bottom - top) * scale)))
+        if page.size != (widthNew, heightNew):
+            page = page.resize((widthNew, heightNew), Image.ANTIALIAS if scale < 1.0 else Image.BICUBIC)
+            if timer != None:
+                timer.mark('resize', page, x)
+
+        if flags & ImageFlags.Frame:
+            page = frameImage(page, profile.foreground, profile.background, profile.size)
+            if timer != None:
+                timer.mark('frame', page, x)
+
+        if flags & ImageFlags.Quantize:
+            page = quantizeImage(page, profile, dither)
+            if timer != None:
+                timer.mark('quantize', page, x)
+
+        top = bottom
+        yield page
+
+
+def convertImage(source, device, flags, dither = ImageDither.Diffusion, timer = None, data = None):
     try:
-        size, palette = KindleData.Profiles[device]
+        profile = KindleData.Profiles[device]
     except KeyError:
         raise RuntimeError('Unexpected output device %s' % device)
 
+    # data is the contents of the source file, if it's already been read.
     try:
-        image = Image.open(source)
+        stream = cStringIO.StringIO(data) if data != None else openSource(source)
+        image = Image.open(stream)
     except IOError:
         raise RuntimeError('Cannot read image file %s' % source)
 
+    # Tall strips are cut into pages instead of shrunk down to fit on one.
+    # The pages are made as they're asked for, rather than all up front.
+    if flags & ImageFlags.Strips and isStrip(image, profile.size):
+        return sliceStrip(source, image, stream, profile, flags, dither, timer)
+
     shrink = flags & ImageFlags.Shrink
     enlarge = flags & ImageFlags.Enlarge
 
-    image = formatImage(image)
+    size = profile.size
+
+    # Whether the image gets rotated, and how many pages it's split into, are
+    # settled here, from the full-sized source image, just as if every page
+    # was resized on its own. Shrinking the whole image first mustn't change
+    # either just by rounding.
+    layout = pageLayout(image.size, size, flags & ImageFlags.Orient, flags & ImageFlags.Split)
+    rotate, numPages = layout
+
+    image = draftImage(image, profile.mode, size, shrink, flags & ImageFlags.Orient, flags & ImageFlags.Split)
+
+    # Opening the file only reads its header, so the image is decoded here,
+    # where a damaged or truncated file can be reported like one that won't
+    # open at all, rather than by whichever stage first needs pixels.
+    try:
+        image.load()
+    except (IOError, ValueError):
+        raise RuntimeError('Cannot read image file %s' % source)
+    if timer != None:
+        timer.mark('decode', image)
+
+    image = formatImage(image, profile.mode)
+    if timer != None:
+        timer.mark('format', image)
+
+    # Shrink the image as early as we can, so rotating, splitting and framing
+    # all work on device-sized images rather than full-sized ones. Since the
+    # box we fit it in accounts for rotating and splitting later, the pages
+    # come out the same size they would if each was shrunk on its own.
+    # Enlarging is left until the end, for the opposite reason.
+    resized = False
+    if shrink:
+        fit = fitSize(image, size, flags & ImageFlags.Orient, flags & ImageFlags.Split, layout)
+        if image.size[0] > fit[0] or image.size[1] > fit[1]:
+            image = resizeImage(image, fit, shrink, False)
+            resized = True
+            if timer != None:
+                timer.mark('resize', image)
+
     if flags & ImageFlags.Orient:
-        image = orientImage(image, size)
+        image = orientImage(image, size, rotate)
+        if timer != None:
+            timer.mark('orient', image)
     
     # Since splitting is now an option, it is possible, at any time, that
     # one image might become two or three or a thousand images, so we move
@@ -269,22 +796,61 @@ def convertImage(source, device, flags):
     images = []
     
     if flags & ImageFlags.Split:
-        images = splitImage(image, size, flags & ImageFlags.RightToLeft)
+        images = splitImage(image, size, flags & ImageFlags.RightToLeft, numPages)
+        if timer != None:
+            timer.mark('split', image)
     else:
         images = [image]
     
     # Loop over every image in the list, and perform these steps on them.
     for x in range(len(images)):
       
-      if enlarge or shrink:
+      if (enlarge or shrink) and not resized:
           images[x] = resizeImage(images[x], size, shrink, enlarge)
+          if timer != None:
+              timer.mark('resize', images[x], x)
           
       if flags & ImageFlags.Frame:
-          # tuple(palette[:3] and tuple(palette[-3:]) refer to black and white,
-          # which happen to be the first/last colors in the palettes defined.
-          images[x] = frameImage(images[x], tuple(palette[:3]), tuple(palette[-3:]), size)
+          images[x] = frameImage(images[x], profile.foreground, profile.background, size)
+          if timer != None:
+              timer.mark('frame', images[x], x)
           
       if flags & ImageFlags.Quantize:
-          images[x] = quantizeImage(images[x], palette)
+          images[x] = quantizeImage(images[x], profile, dither)
+          if timer != None:
+              timer.mark('quantize', images[x], x)
 
     return images
+
+
+def formatSupported(format):
+    Image.init()
+    return ImageFormat.Encoders.get(format) in Image.SAVE
+
+
+def encodeImage(image, output, device, format = ImageFormat.Png, compressLevel = 6, quality = 85):
+    try:
+        profile = KindleData.Profiles[device]
+    except KeyError:
+        raise RuntimeError('Unexpected output device %s' % device)
+
+    if format == ImageFormat.Png:
+        options = {'compress_level': compressLevel}
+        # PIL writes every palette image with 8 bits per pixel, but a
+        # quantized page never uses more colors than the device palette has,
+        # so it can be packed down to 2 or 4 bits.
+        if image.mode == 'P':
+            options['bits'] = profile.paletteBits
+    elif format in ImageFormat.Formats:
+        options = {'quality': quality}
+        # There's no palette in JPEG or WebP, so quantized pages go back to
+        # plain grayscale or RGB, still limited to the device's colors.
+        if image.mode == 'P':
+            image = image.convert(profile.mode)
+    else:
+        raise RuntimeError('Unexpected output format %s' % format)
+
+    try:
+        image.save(output, ImageFormat.Encoders[format], **options)
+    except (IOError, ValueError, KeyError):
+        raise RuntimeError('Cannot encode image as %s' % ImageFormat.Encoders[format])
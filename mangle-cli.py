@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import sys
+import json
+import multiprocessing
+from optparse import OptionParser
+
+from bookfile import Book
+from export import BookExporter, ExportProgress, SourcePrefetcher
+from cache import ConversionCache
+
+
+def report(stream, message):
+    stream.write((u'%s\n' % message).encode(stream.encoding or 'utf-8', 'replace'))
+
+
+def main(argv):
+    parser = OptionParser(
+        usage='%prog [options] BOOK OUTPUT',
+        description='Export a Mangle book without opening the GUI. OUTPUT is the '
+                    'directory to export to, or the .cbz file to create if the '
+                    'book is set to export to CBZ.'
+    )
+    parser.add_option('-q', '--quiet', action='store_true', default=False,
+                      help='only report errors')
+    parser.add_option('-j', '--jobs', type='int', default=None,
+                      help='number of images to convert in parallel (default: number of CPUs)')
+    parser.add_option('--prefetch', type='int', default=SourcePrefetcher.DefaultDepth,
+                      help='number of images to read ahead of the one being converted, or 0 for none (default: %default)')
+    parser.add_option('--cache-dir', default=ConversionCache.DefaultDirectory,
+                      help='where to keep converted pages for reuse by later exports (default: %default)')
+    parser.add_option('--cache-size', type='int', default=ConversionCache.DefaultMaxSize / (1024 * 1024),
+                      help='maximum size of the cache in MB (default: %default)')
+    parser.add_option('--no-cache', action='store_true', default=False,
+                      help='convert every image, without reading or filling the cache')
+    parser.add_option('--incremental', action='store_true', dest='incremental', default=None,
+                      help='only convert images that changed since the last export to OUTPUT')
+    parser.add_option('--full', action='store_false', dest='incremental',
+                      help='convert every image, even if the book is set to export incrementally')
+    parser.add_option('--stats', metavar='FILE', default=None,
+                      help='write how long each stage took for every image to FILE, one JSON object per line')
+    options, args = parser.parse_args(argv[1:])
+
+    if len(args) != 2:
+        parser.error('expected a book file and an output path')
+
+    filename, target = args
+
+    # Everything comes from the book file, so there's no need for the GUI's
+    # defaults file, let alone for creating one wherever we happen to be run.
+    book = Book(None)
+    try:
+        book.load(filename)
+    except RuntimeError, error:
+        report(sys.stderr, error)
+        return 1
+
+    if len(book.images) == 0:
+        report(sys.stderr, 'This book has no images to export')
+        return 1
+
+    if options.incremental != None:
+        book.incremental = options.incremental
+
+    cache = None
+    if not options.no_cache:
+        cache = ConversionCache(os.path.abspath(options.cache_dir), options.cache_size * 1024 * 1024)
+
+    progress = ExportProgress(len(book.images))
+
+    statsFile = None
+    if options.stats:
+        try:
+            statsFile = open(options.stats, 'w')
+        except IOError:
+            report(sys.stderr, 'Cannot create stats file %s' % options.stats)
+            return 1
+
+    def listener(source, stages):
+        progress.listener(source, stages)
+        if statsFile != None:
+            statsFile.write(json.dumps({'source': source, 'stages': stages}) + '\n')
+
+    exporter = BookExporter(book, os.path.abspath(target), options.jobs, cache, listener, options.prefetch)
+
+    try:
+        exporter.begin()
+    except RuntimeError, error:
+        report(sys.stderr, error)
+        return 1
+
+    failed = 0
+    closed = False
+    try:
+        for index in xrange(len(book.images)):
+            source = unicode(book.images[index])
+            if not options.quiet:
+                report(sys.stdout, u'[%d/%d] Processing %s... (%s)' % (
+                    index + 1, len(book.images), os.path.split(source)[1], progress.status()))
+
+            try:
+                progress.advance(exporter.exportNext())
+            except RuntimeError, error:
+                report(sys.stderr, error)
+                progress.advance()
+                failed += 1
+    finally:
+        # Even if something unexpected went wrong, the worker processes still
+        # need shutting down, and the pages written so far finishing off.
+        try:
+            exporter.close()
+            closed = True
+        except RuntimeError, error:
+            report(sys.stderr, error)
+        finally:
+            if statsFile != None:
+                statsFile.close()
+
+    if not closed:
+        return 1
+
+    if not options.quiet:
+        report(sys.stdout, progress.summary())
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+    sys.exit(main(sys.argv))
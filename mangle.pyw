@@ -17,13 +17,19 @@
 
 
 import sys
+import multiprocessing
 from PyQt4 import QtGui
 
 from book import MainWindowBook
 
 
-application = QtGui.QApplication(sys.argv)
-filename = sys.argv[1] if len(sys.argv) > 1 else None
-window = MainWindowBook(filename)
-window.show()
-application.exec_()
+# Exports convert images in worker processes, which (on Windows) start by
+# importing this script, so don't open another window when that happens.
+if __name__ == '__main__':
+    multiprocessing.freeze_support()
+
+    application = QtGui.QApplication(sys.argv)
+    filename = sys.argv[1] if len(sys.argv) > 1 else None
+    window = MainWindowBook(filename)
+    window.show()
+    application.exec_()
@@ -0,0 +1,144 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+
+from archive import statSource
+from cache import hashFile
+
+
+# Records which pages of an exported directory came from which source image,
+# and what that image and the export settings looked like at the time. The
+# next export of the same book into the same directory can then leave alone
+# every page whose inputs haven't changed.
+class ExportManifest:
+    Version = 1
+
+    def __init__(self, filename, settings):
+        self.filename = filename
+        # JSON hands lists back, so that's what we compare against.
+        self.settings = list(settings)
+        self.previous = []
+        self.sources = {}
+        self.entries = []
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Reads the manifest left by the last export, if there is one.
+    # A missing or unreadable manifest just means nothing is known to
+    # be up to date, so everything gets exported again.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def load(self):
+        try:
+            manifestFile = open(self.filename, 'rb')
+            try:
+                data = json.load(manifestFile)
+            finally:
+                manifestFile.close()
+        except (IOError, ValueError):
+            return
+
+        if not isinstance(data, dict) or data.get('version') != ExportManifest.Version:
+            return
+
+        self.previous = data.get('sources', [])
+        for entry in self.previous:
+            self.sources[entry['source']] = entry
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns the entry from the last export for a source image, if
+    # neither the image nor the settings have changed since, or None.
+    # The file is only hashed if its size or modification time differ.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def findUnchanged(self, source):
+        entry = self.sources.get(source)
+        if entry == None or entry['settings'] != self.settings:
+            return None
+
+        try:
+            size, mtime = statSource(source)
+            if entry['mtime'] == mtime and entry['size'] == size:
+                return entry
+            if entry['hash'] == hashFile(source):
+                return dict(entry, mtime=mtime, size=size)
+        except (IOError, OSError):
+            pass
+
+        return None
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Returns True if the pages of an unchanged source image are still
+    # on disk under the numbers we're about to give them.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def isExported(self, entry, start, outDir, nameTemplate):
+        if entry['start'] != start:
+            return False
+
+        for counter in xrange(start, start + entry['count']):
+            if not os.path.isfile(os.path.join(outDir, nameTemplate % counter)):
+                return False
+
+        return True
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Records an unchanged source image whose pages were left as-is.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def keep(self, entry):
+        self.entries.append(entry)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Records a source image whose pages were just written out, given
+    # the size, modification time and hash it was converted with.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def add(self, source, start, count, description):
+        # If we couldn't describe it, it'll just be exported again next time.
+        if description == None:
+            return
+        size, mtime, contentHash = description
+
+        self.entries.append({
+            'source': source,
+            'mtime': mtime,
+            'size': size,
+            'hash': contentHash,
+            'settings': self.settings,
+            'start': start,
+            'count': count
+        })
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Writes the manifest out. counter is the number of the first page
+    # not written by this export. If the export finished, the pages
+    # past that point are left over from a longer book and are
+    # returned so they can be removed. If it was cut short, those
+    # pages haven't been touched, so they stay in the manifest.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def save(self, counter, finished):
+        entries = list(self.entries)
+        stale = []
+
+        if finished:
+            end = max([entry['start'] + entry['count'] for entry in self.previous] or [0])
+            stale = range(counter, end)
+        else:
+            entries.extend([entry for entry in self.previous if entry['start'] >= counter])
+
+        manifestFile = open(self.filename, 'wb')
+        try:
+            json.dump({'version': ExportManifest.Version, 'sources': entries}, manifestFile, indent=1)
+        finally:
+            manifestFile.close()
+
+        return stale
@@ -18,7 +18,7 @@ from PyQt4 import QtGui, QtCore
 
 from copy import deepcopy
 
-from image import ImageFlags
+from image import ImageFlags, ImageDither, ImageFormat
 from ui.options_ui import Ui_DialogOptions
 
 
@@ -97,8 +97,10 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
     def cbz_changed(self, value):
         if value == QtCore.Qt.Checked:
             self.checkboxOverwrite.setDisabled(True)
+            self.checkboxIncremental.setDisabled(True)
         else:
             self.checkboxOverwrite.setDisabled(False)
+            self.checkboxIncremental.setDisabled(False)
 
     #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
     # Slot called when the Orient checkbox is changed.
@@ -117,6 +119,42 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
             self.checkboxOrient.setChecked(QtCore.Qt.Unchecked)
             self.checkboxRightToLeft.setDisabled(False)
 
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Slot called when the Quantize checkbox is changed.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def quantize_changed(self, value):
+        self.comboBoxDither.setDisabled(value == QtCore.Qt.Unchecked)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Slot called when the output format is changed.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def format_changed(self, index):
+        png = ImageFormat.Formats[index] == ImageFormat.Png
+        self.spinBoxCompressLevel.setDisabled(not png)
+        self.spinBoxQuality.setDisabled(png)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Slot called when the Cache checkbox is changed.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def cache_changed(self, value):
+        disabled = value == QtCore.Qt.Unchecked
+        self.spinBoxCacheSize.setDisabled(disabled)
+        self.lineEditCacheDirectory.setDisabled(disabled)
+        self.pushButtonCacheDirectory.setDisabled(disabled)
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Slot called when the button next to the cache directory is
+    # clicked.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def browse_cache_directory(self):
+        directory = QtGui.QFileDialog.getExistingDirectory(
+            self,
+            'Select a directory to keep converted pages in',
+            self.lineEditCacheDirectory.text()
+        )
+        if not directory.isNull():
+            self.lineEditCacheDirectory.setText(directory)
+
     #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
     # Takes the options stored in a book object and changes the UI
     # objects to reflect those options.
@@ -124,8 +162,13 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
     def moveOptionsToDialog(self):
         self.lineEditTitle.setText(self.book.title or 'Untitled')
         self.comboBoxDevice.setCurrentIndex(max(self.comboBoxDevice.findText(self.book.device), 0))
+        # Like the dithering methods, the formats are listed in the same order as ImageFormat.Formats.
+        self.comboBoxFormat.setCurrentIndex(ImageFormat.Formats.index(self.book.outputFormat))
+        self.spinBoxCompressLevel.setValue(self.book.compressLevel)
+        self.spinBoxQuality.setValue(self.book.quality)
         self.checkboxOverwrite.setChecked(QtCore.Qt.Checked if self.book.overwrite else QtCore.Qt.Unchecked)
         self.checkboxCBZ.setChecked(QtCore.Qt.Checked if self.book.cbz else QtCore.Qt.Unchecked)
+        self.checkboxIncremental.setChecked(QtCore.Qt.Checked if self.book.incremental else QtCore.Qt.Unchecked)
         self.checkboxOrient.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Orient else QtCore.Qt.Unchecked)
         self.checkboxSplit.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Split else QtCore.Qt.Unchecked)
         self.checkboxShrink.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Shrink else QtCore.Qt.Unchecked)
@@ -133,11 +176,22 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
         self.checkboxQuantize.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Quantize else QtCore.Qt.Unchecked)
         self.checkboxFrame.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Frame else QtCore.Qt.Unchecked)
         self.checkboxRightToLeft.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.RightToLeft else QtCore.Qt.Unchecked)
+        self.checkboxStrips.setChecked(QtCore.Qt.Checked if self.book.imageFlags & ImageFlags.Strips else QtCore.Qt.Unchecked)
+        # The combo box lists the dithering methods in the same order as ImageDither.Methods.
+        self.comboBoxDither.setCurrentIndex(ImageDither.Methods.index(self.book.dither))
+        self.spinBoxWorkers.setValue(self.book.workers)
+        self.checkboxCache.setChecked(QtCore.Qt.Checked if self.book.cache else QtCore.Qt.Unchecked)
+        self.spinBoxCacheSize.setValue(self.book.cacheSize)
+        self.lineEditCacheDirectory.setText(self.book.cacheDirectory)
         
         # No need for the option if splitting is disabled. And it won't signal
         # the "changed" event if it starts out disabled.
         if self.checkboxSplit.checkState() == QtCore.Qt.Unchecked:
             self.checkboxRightToLeft.setDisabled(True)
+        if self.checkboxQuantize.checkState() == QtCore.Qt.Unchecked:
+            self.comboBoxDither.setDisabled(True)
+        self.format_changed(self.comboBoxFormat.currentIndex())
+        self.cache_changed(self.checkboxCache.checkState())
 
     #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
     # Stores the selected options in the book object.
@@ -145,8 +199,13 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
     def moveDialogToOptions(self):
         title = self.lineEditTitle.text()
         device = self.comboBoxDevice.itemText(self.comboBoxDevice.currentIndex())
+        outputFormat = ImageFormat.Formats[self.comboBoxFormat.currentIndex()]
+        compressLevel = self.spinBoxCompressLevel.value()
+        quality = self.spinBoxQuality.value()
         overwrite = self.checkboxOverwrite.checkState() == QtCore.Qt.Checked
         cbz = self.checkboxCBZ.checkState() == QtCore.Qt.Checked
+        incremental = self.checkboxIncremental.checkState() == QtCore.Qt.Checked
+        dither = ImageDither.Methods[self.comboBoxDither.currentIndex()]
 
         imageFlags = 0
         if self.checkboxOrient.checkState() == QtCore.Qt.Checked:
@@ -163,19 +222,38 @@ class DialogOptions(QtGui.QDialog, Ui_DialogOptions):
             imageFlags |= ImageFlags.Frame
         if self.checkboxRightToLeft.checkState() == QtCore.Qt.Checked:
             imageFlags |= ImageFlags.RightToLeft
+        if self.checkboxStrips.checkState() == QtCore.Qt.Checked:
+            imageFlags |= ImageFlags.Strips
 
         modified = (
             self.book.title != title or
             self.book.device != device or
+            self.book.outputFormat != outputFormat or
+            self.book.compressLevel != compressLevel or
+            self.book.quality != quality or
             self.book.overwrite != overwrite or
             self.book.imageFlags != imageFlags or
-            self.book.cbz != cbz
+            self.book.dither != dither or
+            self.book.cbz != cbz or
+            self.book.incremental != incremental
         )
 
         if modified:
             self.book.modified = True
             self.book.title = title
             self.book.device = device
+            self.book.outputFormat = outputFormat
+            self.book.compressLevel = compressLevel
+            self.book.quality = quality
             self.book.overwrite = overwrite
             self.book.imageFlags = imageFlags
+            self.book.dither = dither
             self.book.cbz = cbz
+            self.book.incremental = incremental
+
+        # These aren't part of the book file, so changing them doesn't make
+        # it need saving.
+        self.book.workers = self.spinBoxWorkers.value()
+        self.book.cache = self.checkboxCache.checkState() == QtCore.Qt.Checked
+        self.book.cacheSize = self.spinBoxCacheSize.value()
+        self.book.cacheDirectory = unicode(self.lineEditCacheDirectory.text()).strip() or self.book.DefaultCacheDirectory
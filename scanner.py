@@ -0,0 +1,171 @@
+# Copyright (C) 2010  Alex Yatskov
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import stat
+import threading
+from multiprocessing.pool import ThreadPool
+
+from archive import ArchiveExtensions, ImageExtensions
+
+# The scandir module tells files and directories apart from what the
+# directory listing itself says, without asking about every entry separately.
+# Without it, we fall back on os.listdir().
+try:
+    from scandir import scandir
+except ImportError:
+    scandir = None
+
+
+# Everything that can be added to a book from a directory.
+ScannedExtensions = ImageExtensions + ArchiveExtensions
+
+
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+# Returns the images and archives in a directory, and the
+# directories in it, each in order of their names. Symbolic links to
+# directories aren't followed, just like os.walk().
+#xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+def listDirectory(directory):
+    files = []
+    subdirs = []
+
+    if scandir != None:
+        for entry in scandir(directory):
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+            elif os.path.splitext(entry.name)[1].lower() in ScannedExtensions and entry.is_file():
+                files.append(entry.path)
+    else:
+        # Without the entry types, every name with an image's extension is
+        # taken to be a file, so only the rest need checking. Over a network,
+        # that's most of the round trips saved.
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if os.path.splitext(name)[1].lower() in ScannedExtensions:
+                files.append(path)
+                continue
+            try:
+                if stat.S_ISDIR(os.lstat(path).st_mode):
+                    subdirs.append(path)
+            except OSError:
+                pass
+
+    files.sort()
+    subdirs.sort()
+
+    return files, subdirs
+
+
+# Finds every image and archive under a set of directories. The directories
+# are listed on a pool of threads, each one as soon as its parent has been,
+# so waiting on one slow directory (over a network share, say) doesn't hold
+# up its siblings. The results still come out in the same order os.walk()
+# would go through them, in batches, as soon as everything before them is in.
+# One scanner can only run one scan at a time.
+class DirectoryScanner:
+    DefaultThreads = 8
+    BatchSize = 500
+
+    def __init__(self, threads = DefaultThreads):
+        self.threads = threads
+        self.pool = None
+        self.next = 0
+        self.results = {}
+        self.stopped = False
+        self.ready = threading.Condition()
+
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    # Yields lists of the files found under the given directories.
+    # Directories that can't be read are skipped.
+    #xxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxxx
+    def scan(self, directories):
+        self.pool = ThreadPool(self.threads)
+        self.results = {}
+        self.stopped = False
+
+        try:
+            pending = [self.submit(directory) for directory in reversed(directories)]
+            batch = []
+
+            while pending:
+                key = pending.pop()
+
+                # Hand over what we have rather than sit on it while waiting.
+                if batch and not self.isScanned(key):
+                    yield batch
+                    batch = []
+
+                files, children = self.wait(key)
+                batch.extend(files)
+                pending.extend(reversed(children))
+
+                if len(batch) >= DirectoryScanner.BatchSize:
+                    yield batch
+                    batch = []
+
+            if batch:
+                yield batch
+        finally:
+            # If we were stopped early, whatever is still queued is skipped.
+            self.stopped = True
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+
+    def submit(self, directory):
+        self.ready.acquire()
+        try:
+            key = self.next
+            self.next = self.next + 1
+        finally:
+            self.ready.release()
+
+        self.pool.apply_async(self.scanDirectory, (key, directory))
+        return key
+
+    def scanDirectory(self, key, directory):
+        files = []
+        children = []
+
+        try:
+            if not self.stopped:
+                try:
+                    files, subdirs = listDirectory(directory)
+                except OSError:
+                    subdirs = []
+                children = [self.submit(subdir) for subdir in subdirs]
+        finally:
+            # Whatever happens, record something, so nobody waits forever.
+            self.ready.acquire()
+            self.results[key] = (files, children)
+            self.ready.notifyAll()
+            self.ready.release()
+
+    def isScanned(self, key):
+        self.ready.acquire()
+        try:
+            return key in self.results
+        finally:
+            self.ready.release()
+
+    def wait(self, key):
+        self.ready.acquire()
+        try:
+            while key not in self.results:
+                self.ready.wait()
+            return self.results.pop(key)
+        finally:
+            self.ready.release()
@@ -24,6 +24,7 @@ import py2exe
 sys.argv.append('py2exe')
 setup(
     windows=[{'script': 'mangle.pyw'}],
+    console=[{'script': 'mangle-cli.py'}],
     options={'py2exe': {'bundle_files': 1, 'includes': ['sip']}},
     zipfile=None
 )
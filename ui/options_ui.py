@@ -12,7 +12,7 @@ from PyQt4 import QtCore, QtGui
 class Ui_DialogOptions(object):
     def setupUi(self, DialogOptions):
         DialogOptions.setObjectName("DialogOptions")
-        DialogOptions.resize(333, 475)
+        DialogOptions.resize(333, 752)
         sizePolicy = QtGui.QSizePolicy(QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Expanding)
         sizePolicy.setHorizontalStretch(0)
         sizePolicy.setVerticalStretch(0)
@@ -53,6 +53,32 @@ class Ui_DialogOptions(object):
         self.comboBoxDevice.addItem("")
         self.comboBoxDevice.addItem("")
         self.formLayout_2.setWidget(0, QtGui.QFormLayout.FieldRole, self.comboBoxDevice)
+        self.labelFormat = QtGui.QLabel(self.groupBox_2)
+        self.labelFormat.setObjectName("labelFormat")
+        self.formLayout_2.setWidget(1, QtGui.QFormLayout.LabelRole, self.labelFormat)
+        self.comboBoxFormat = QtGui.QComboBox(self.groupBox_2)
+        self.comboBoxFormat.setObjectName("comboBoxFormat")
+        self.comboBoxFormat.addItem("")
+        self.comboBoxFormat.addItem("")
+        self.comboBoxFormat.addItem("")
+        self.formLayout_2.setWidget(1, QtGui.QFormLayout.FieldRole, self.comboBoxFormat)
+        self.labelCompressLevel = QtGui.QLabel(self.groupBox_2)
+        self.labelCompressLevel.setObjectName("labelCompressLevel")
+        self.formLayout_2.setWidget(2, QtGui.QFormLayout.LabelRole, self.labelCompressLevel)
+        self.spinBoxCompressLevel = QtGui.QSpinBox(self.groupBox_2)
+        self.spinBoxCompressLevel.setMaximum(9)
+        self.spinBoxCompressLevel.setProperty("value", 6)
+        self.spinBoxCompressLevel.setObjectName("spinBoxCompressLevel")
+        self.formLayout_2.setWidget(2, QtGui.QFormLayout.FieldRole, self.spinBoxCompressLevel)
+        self.labelQuality = QtGui.QLabel(self.groupBox_2)
+        self.labelQuality.setObjectName("labelQuality")
+        self.formLayout_2.setWidget(3, QtGui.QFormLayout.LabelRole, self.labelQuality)
+        self.spinBoxQuality = QtGui.QSpinBox(self.groupBox_2)
+        self.spinBoxQuality.setMinimum(1)
+        self.spinBoxQuality.setMaximum(100)
+        self.spinBoxQuality.setProperty("value", 85)
+        self.spinBoxQuality.setObjectName("spinBoxQuality")
+        self.formLayout_2.setWidget(3, QtGui.QFormLayout.FieldRole, self.spinBoxQuality)
         self.verticalLayout_2.addLayout(self.formLayout_2)
         self.checkboxOverwrite = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxOverwrite.setEnabled(True)
@@ -61,6 +87,9 @@ class Ui_DialogOptions(object):
         self.checkboxCBZ = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxCBZ.setObjectName("checkboxCBZ")
         self.verticalLayout_2.addWidget(self.checkboxCBZ)
+        self.checkboxIncremental = QtGui.QCheckBox(self.groupBox_2)
+        self.checkboxIncremental.setObjectName("checkboxIncremental")
+        self.verticalLayout_2.addWidget(self.checkboxIncremental)
         self.checkboxOrient = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxOrient.setAutoExclusive(False)
         self.checkboxOrient.setObjectName("checkboxOrient")
@@ -77,6 +106,9 @@ class Ui_DialogOptions(object):
         self.checkboxRightToLeft.setObjectName("checkboxRightToLeft")
         self.horizontalLayout.addWidget(self.checkboxRightToLeft)
         self.verticalLayout_2.addLayout(self.horizontalLayout)
+        self.checkboxStrips = QtGui.QCheckBox(self.groupBox_2)
+        self.checkboxStrips.setObjectName("checkboxStrips")
+        self.verticalLayout_2.addWidget(self.checkboxStrips)
         self.checkboxShrink = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxShrink.setObjectName("checkboxShrink")
         self.verticalLayout_2.addWidget(self.checkboxShrink)
@@ -86,18 +118,78 @@ class Ui_DialogOptions(object):
         self.checkboxQuantize = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxQuantize.setObjectName("checkboxQuantize")
         self.verticalLayout_2.addWidget(self.checkboxQuantize)
+        self.horizontalLayout_3 = QtGui.QHBoxLayout()
+        self.horizontalLayout_3.setObjectName("horizontalLayout_3")
+        spacerItem1 = QtGui.QSpacerItem(20, 20, QtGui.QSizePolicy.Fixed, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_3.addItem(spacerItem1)
+        self.labelDither = QtGui.QLabel(self.groupBox_2)
+        self.labelDither.setObjectName("labelDither")
+        self.horizontalLayout_3.addWidget(self.labelDither)
+        self.comboBoxDither = QtGui.QComboBox(self.groupBox_2)
+        self.comboBoxDither.setObjectName("comboBoxDither")
+        self.comboBoxDither.addItem("")
+        self.comboBoxDither.addItem("")
+        self.comboBoxDither.addItem("")
+        self.horizontalLayout_3.addWidget(self.comboBoxDither)
+        self.verticalLayout_2.addLayout(self.horizontalLayout_3)
         self.checkboxFrame = QtGui.QCheckBox(self.groupBox_2)
         self.checkboxFrame.setObjectName("checkboxFrame")
         self.verticalLayout_2.addWidget(self.checkboxFrame)
         self.verticalLayout_4.addWidget(self.groupBox_2)
-        spacerItem1 = QtGui.QSpacerItem(20, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.verticalLayout_4.addItem(spacerItem1)
+        self.groupBox_3 = QtGui.QGroupBox(DialogOptions)
+        self.groupBox_3.setObjectName("groupBox_3")
+        self.verticalLayout_5 = QtGui.QVBoxLayout(self.groupBox_3)
+        self.verticalLayout_5.setObjectName("verticalLayout_5")
+        self.formLayout_4 = QtGui.QFormLayout()
+        self.formLayout_4.setFieldGrowthPolicy(QtGui.QFormLayout.AllNonFixedFieldsGrow)
+        self.formLayout_4.setObjectName("formLayout_4")
+        self.labelWorkers = QtGui.QLabel(self.groupBox_3)
+        self.labelWorkers.setObjectName("labelWorkers")
+        self.formLayout_4.setWidget(0, QtGui.QFormLayout.LabelRole, self.labelWorkers)
+        self.spinBoxWorkers = QtGui.QSpinBox(self.groupBox_3)
+        self.spinBoxWorkers.setMinimum(0)
+        self.spinBoxWorkers.setMaximum(64)
+        self.spinBoxWorkers.setObjectName("spinBoxWorkers")
+        self.formLayout_4.setWidget(0, QtGui.QFormLayout.FieldRole, self.spinBoxWorkers)
+        self.verticalLayout_5.addLayout(self.formLayout_4)
+        self.checkboxCache = QtGui.QCheckBox(self.groupBox_3)
+        self.checkboxCache.setObjectName("checkboxCache")
+        self.verticalLayout_5.addWidget(self.checkboxCache)
+        self.formLayout_3 = QtGui.QFormLayout()
+        self.formLayout_3.setFieldGrowthPolicy(QtGui.QFormLayout.AllNonFixedFieldsGrow)
+        self.formLayout_3.setObjectName("formLayout_3")
+        self.labelCacheSize = QtGui.QLabel(self.groupBox_3)
+        self.labelCacheSize.setObjectName("labelCacheSize")
+        self.formLayout_3.setWidget(0, QtGui.QFormLayout.LabelRole, self.labelCacheSize)
+        self.spinBoxCacheSize = QtGui.QSpinBox(self.groupBox_3)
+        self.spinBoxCacheSize.setMinimum(16)
+        self.spinBoxCacheSize.setMaximum(65536)
+        self.spinBoxCacheSize.setSingleStep(64)
+        self.spinBoxCacheSize.setProperty("value", 512)
+        self.spinBoxCacheSize.setObjectName("spinBoxCacheSize")
+        self.formLayout_3.setWidget(0, QtGui.QFormLayout.FieldRole, self.spinBoxCacheSize)
+        self.labelCacheDirectory = QtGui.QLabel(self.groupBox_3)
+        self.labelCacheDirectory.setObjectName("labelCacheDirectory")
+        self.formLayout_3.setWidget(1, QtGui.QFormLayout.LabelRole, self.labelCacheDirectory)
+        self.horizontalLayout_4 = QtGui.QHBoxLayout()
+        self.horizontalLayout_4.setObjectName("horizontalLayout_4")
+        self.lineEditCacheDirectory = QtGui.QLineEdit(self.groupBox_3)
+        self.lineEditCacheDirectory.setObjectName("lineEditCacheDirectory")
+        self.horizontalLayout_4.addWidget(self.lineEditCacheDirectory)
+        self.pushButtonCacheDirectory = QtGui.QPushButton(self.groupBox_3)
+        self.pushButtonCacheDirectory.setObjectName("pushButtonCacheDirectory")
+        self.horizontalLayout_4.addWidget(self.pushButtonCacheDirectory)
+        self.formLayout_3.setLayout(1, QtGui.QFormLayout.FieldRole, self.horizontalLayout_4)
+        self.verticalLayout_5.addLayout(self.formLayout_3)
+        self.verticalLayout_4.addWidget(self.groupBox_3)
+        spacerItem2 = QtGui.QSpacerItem(20, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        self.verticalLayout_4.addItem(spacerItem2)
         self.horizontalLayout_2 = QtGui.QHBoxLayout()
         self.horizontalLayout_2.setObjectName("horizontalLayout_2")
         self.verticalLayout = QtGui.QVBoxLayout()
         self.verticalLayout.setObjectName("verticalLayout")
-        spacerItem2 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.verticalLayout.addItem(spacerItem2)
+        spacerItem3 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        self.verticalLayout.addItem(spacerItem3)
         self.restoreDefaults = QtGui.QPushButton(DialogOptions)
         self.restoreDefaults.setObjectName("restoreDefaults")
         self.verticalLayout.addWidget(self.restoreDefaults)
@@ -105,12 +197,12 @@ class Ui_DialogOptions(object):
         self.saveDefaults.setObjectName("saveDefaults")
         self.verticalLayout.addWidget(self.saveDefaults)
         self.horizontalLayout_2.addLayout(self.verticalLayout)
-        spacerItem3 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
-        self.horizontalLayout_2.addItem(spacerItem3)
+        spacerItem4 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Expanding, QtGui.QSizePolicy.Minimum)
+        self.horizontalLayout_2.addItem(spacerItem4)
         self.verticalLayout_3 = QtGui.QVBoxLayout()
         self.verticalLayout_3.setObjectName("verticalLayout_3")
-        spacerItem4 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
-        self.verticalLayout_3.addItem(spacerItem4)
+        spacerItem5 = QtGui.QSpacerItem(0, 0, QtGui.QSizePolicy.Minimum, QtGui.QSizePolicy.Expanding)
+        self.verticalLayout_3.addItem(spacerItem5)
         self.buttonBox = QtGui.QDialogButtonBox(DialogOptions)
         self.buttonBox.setOrientation(QtCore.Qt.Horizontal)
         self.buttonBox.setStandardButtons(QtGui.QDialogButtonBox.Cancel|QtGui.QDialogButtonBox.Ok)
@@ -128,18 +220,33 @@ class Ui_DialogOptions(object):
         QtCore.QObject.connect(self.checkboxOrient, QtCore.SIGNAL("stateChanged(int)"), DialogOptions.orient_changed)
         QtCore.QObject.connect(self.checkboxSplit, QtCore.SIGNAL("stateChanged(int)"), DialogOptions.split_changed)
         QtCore.QObject.connect(self.checkboxCBZ, QtCore.SIGNAL("stateChanged(int)"), DialogOptions.cbz_changed)
+        QtCore.QObject.connect(self.comboBoxFormat, QtCore.SIGNAL("currentIndexChanged(int)"), DialogOptions.format_changed)
+        QtCore.QObject.connect(self.checkboxQuantize, QtCore.SIGNAL("stateChanged(int)"), DialogOptions.quantize_changed)
+        QtCore.QObject.connect(self.checkboxCache, QtCore.SIGNAL("stateChanged(int)"), DialogOptions.cache_changed)
+        QtCore.QObject.connect(self.pushButtonCacheDirectory, QtCore.SIGNAL("clicked()"), DialogOptions.browse_cache_directory)
         QtCore.QMetaObject.connectSlotsByName(DialogOptions)
         DialogOptions.setTabOrder(self.lineEditTitle, self.comboBoxDevice)
-        DialogOptions.setTabOrder(self.comboBoxDevice, self.checkboxOverwrite)
+        DialogOptions.setTabOrder(self.comboBoxDevice, self.comboBoxFormat)
+        DialogOptions.setTabOrder(self.comboBoxFormat, self.spinBoxCompressLevel)
+        DialogOptions.setTabOrder(self.spinBoxCompressLevel, self.spinBoxQuality)
+        DialogOptions.setTabOrder(self.spinBoxQuality, self.checkboxOverwrite)
         DialogOptions.setTabOrder(self.checkboxOverwrite, self.checkboxCBZ)
-        DialogOptions.setTabOrder(self.checkboxCBZ, self.checkboxOrient)
+        DialogOptions.setTabOrder(self.checkboxCBZ, self.checkboxIncremental)
+        DialogOptions.setTabOrder(self.checkboxIncremental, self.checkboxOrient)
         DialogOptions.setTabOrder(self.checkboxOrient, self.checkboxSplit)
         DialogOptions.setTabOrder(self.checkboxSplit, self.checkboxRightToLeft)
-        DialogOptions.setTabOrder(self.checkboxRightToLeft, self.checkboxShrink)
+        DialogOptions.setTabOrder(self.checkboxRightToLeft, self.checkboxStrips)
+        DialogOptions.setTabOrder(self.checkboxStrips, self.checkboxShrink)
         DialogOptions.setTabOrder(self.checkboxShrink, self.checkboxEnlarge)
         DialogOptions.setTabOrder(self.checkboxEnlarge, self.checkboxQuantize)
-        DialogOptions.setTabOrder(self.checkboxQuantize, self.checkboxFrame)
-        DialogOptions.setTabOrder(self.checkboxFrame, self.restoreDefaults)
+        DialogOptions.setTabOrder(self.checkboxQuantize, self.comboBoxDither)
+        DialogOptions.setTabOrder(self.comboBoxDither, self.checkboxFrame)
+        DialogOptions.setTabOrder(self.checkboxFrame, self.spinBoxWorkers)
+        DialogOptions.setTabOrder(self.spinBoxWorkers, self.checkboxCache)
+        DialogOptions.setTabOrder(self.checkboxCache, self.spinBoxCacheSize)
+        DialogOptions.setTabOrder(self.spinBoxCacheSize, self.lineEditCacheDirectory)
+        DialogOptions.setTabOrder(self.lineEditCacheDirectory, self.pushButtonCacheDirectory)
+        DialogOptions.setTabOrder(self.pushButtonCacheDirectory, self.restoreDefaults)
         DialogOptions.setTabOrder(self.restoreDefaults, self.saveDefaults)
         DialogOptions.setTabOrder(self.saveDefaults, self.buttonBox)
 
@@ -156,9 +263,20 @@ class Ui_DialogOptions(object):
         self.comboBoxDevice.setItemText(4, QtGui.QApplication.translate("DialogOptions", "Kindle DXG", None, QtGui.QApplication.UnicodeUTF8))
         self.comboBoxDevice.setItemText(5, QtGui.QApplication.translate("DialogOptions", "nook", None, QtGui.QApplication.UnicodeUTF8))
         self.comboBoxDevice.setItemText(6, QtGui.QApplication.translate("DialogOptions", "nook color", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelFormat.setText(QtGui.QApplication.translate("DialogOptions", "Format", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxFormat.setToolTip(QtGui.QApplication.translate("DialogOptions", "PNG is lossless, and dithered pages are stored with only as many bits per pixel as the device has shades of gray. JPEG and WebP make much smaller files out of color or undithered pages, at some cost in quality.", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxFormat.setItemText(0, QtGui.QApplication.translate("DialogOptions", "PNG", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxFormat.setItemText(1, QtGui.QApplication.translate("DialogOptions", "JPEG", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxFormat.setItemText(2, QtGui.QApplication.translate("DialogOptions", "WebP", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelCompressLevel.setText(QtGui.QApplication.translate("DialogOptions", "Compression", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxCompressLevel.setToolTip(QtGui.QApplication.translate("DialogOptions", "How hard to try to make PNG files smaller. Higher levels take longer to export, but never lose any quality.", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelQuality.setText(QtGui.QApplication.translate("DialogOptions", "Quality", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxQuality.setToolTip(QtGui.QApplication.translate("DialogOptions", "Quality of JPEG and WebP pages. Lower values make smaller files.", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxOverwrite.setText(QtGui.QApplication.translate("DialogOptions", "Overwrite existing files", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxCBZ.setToolTip(QtGui.QApplication.translate("DialogOptions", "Don\'t output the converted images to a directory, but instead store them in a single .cbz archive.", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxCBZ.setText(QtGui.QApplication.translate("DialogOptions", "Output to .cbz", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxIncremental.setToolTip(QtGui.QApplication.translate("DialogOptions", "Only convert the images that were added or changed since the book was last exported to the same directory, and leave the rest of the pages alone.", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxIncremental.setText(QtGui.QApplication.translate("DialogOptions", "Only export changed images", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxOrient.setToolTip(QtGui.QApplication.translate("DialogOptions", "If an image has an aspect ratio too wide for the device\'s screen, rotate it 90 degrees to fit the device\'s aspect ratio.\n"
 "\n"
 "Note: This cannot be enabled simultaneously with \"Split images to match aspect ratio.\"", None, QtGui.QApplication.UnicodeUTF8))
@@ -168,10 +286,28 @@ class Ui_DialogOptions(object):
 "Note: This cannot be enabled simultaneously with \"Orient images to match aspect ratio.\"", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxSplit.setText(QtGui.QApplication.translate("DialogOptions", "Split images to match aspect ratio", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxRightToLeft.setText(QtGui.QApplication.translate("DialogOptions", "Right-to-left page order", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxStrips.setToolTip(QtGui.QApplication.translate("DialogOptions", "If an image is at least twice as tall as the device\'s screen once it fits the screen\'s width, like a webtoon strip, cut it into screen-sized pages from top to bottom instead of shrinking it down to one.", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxStrips.setText(QtGui.QApplication.translate("DialogOptions", "Slice tall strips into pages", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxShrink.setText(QtGui.QApplication.translate("DialogOptions", "Shrink oversized images to fit on screen", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxEnlarge.setText(QtGui.QApplication.translate("DialogOptions", "Enlarge undersized images to fit on screen", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxQuantize.setText(QtGui.QApplication.translate("DialogOptions", "Dither images to match device palette", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelDither.setText(QtGui.QApplication.translate("DialogOptions", "Method", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxDither.setToolTip(QtGui.QApplication.translate("DialogOptions", "Error diffusion gives the smoothest results. Ordered dithering is much faster and still looks good on e-ink screens, but needs NumPy installed; without it, error diffusion is used instead.", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxDither.setItemText(0, QtGui.QApplication.translate("DialogOptions", "Error diffusion", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxDither.setItemText(1, QtGui.QApplication.translate("DialogOptions", "Ordered", None, QtGui.QApplication.UnicodeUTF8))
+        self.comboBoxDither.setItemText(2, QtGui.QApplication.translate("DialogOptions", "None", None, QtGui.QApplication.UnicodeUTF8))
         self.checkboxFrame.setText(QtGui.QApplication.translate("DialogOptions", "Draw frame around images", None, QtGui.QApplication.UnicodeUTF8))
+        self.groupBox_3.setTitle(QtGui.QApplication.translate("DialogOptions", "Performance", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelWorkers.setText(QtGui.QApplication.translate("DialogOptions", "Workers", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxWorkers.setToolTip(QtGui.QApplication.translate("DialogOptions", "How many images to convert at once. Automatic uses one for every processor core; fewer leaves the computer more responsive while exporting.", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxWorkers.setSpecialValueText(QtGui.QApplication.translate("DialogOptions", "Automatic", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxCache.setToolTip(QtGui.QApplication.translate("DialogOptions", "Keep the pages of every exported image, so exporting the same image with the same settings again, in this book or any other, just copies them.", None, QtGui.QApplication.UnicodeUTF8))
+        self.checkboxCache.setText(QtGui.QApplication.translate("DialogOptions", "Reuse pages converted by earlier exports", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelCacheSize.setText(QtGui.QApplication.translate("DialogOptions", "Cache size", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxCacheSize.setToolTip(QtGui.QApplication.translate("DialogOptions", "The least recently used pages are thrown away once the cache grows past this size.", None, QtGui.QApplication.UnicodeUTF8))
+        self.spinBoxCacheSize.setSuffix(QtGui.QApplication.translate("DialogOptions", " MB", None, QtGui.QApplication.UnicodeUTF8))
+        self.labelCacheDirectory.setText(QtGui.QApplication.translate("DialogOptions", "Cache directory", None, QtGui.QApplication.UnicodeUTF8))
+        self.pushButtonCacheDirectory.setText(QtGui.QApplication.translate("DialogOptions", "...", None, QtGui.QApplication.UnicodeUTF8))
         self.restoreDefaults.setText(QtGui.QApplication.translate("DialogOptions", "Restore &Defaults", None, QtGui.QApplication.UnicodeUTF8))
         self.saveDefaults.setText(QtGui.QApplication.translate("DialogOptions", "&Save Defaults", None, QtGui.QApplication.UnicodeUTF8))
 